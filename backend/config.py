@@ -3,60 +3,80 @@ Configuration management for Ikarus 3D Application
 """
 
 import os
+import logging
+from functools import lru_cache
 from typing import List, Optional
-from pydantic import BaseSettings, Field
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class Settings(BaseSettings):
     """Application settings"""
     
     # Application
-    app_name: str = Field(default="Ikarus 3D Product Recommendation System", env="APP_NAME")
-    app_version: str = Field(default="1.0.0", env="APP_VERSION")
-    debug: bool = Field(default=True, env="DEBUG")
-    log_level: str = Field(default="INFO", env="LOG_LEVEL")
+    app_name: str = Field(default="Ikarus 3D Product Recommendation System")
+    app_version: str = Field(default="1.0.0")
+    debug: bool = Field(default=True)
+    log_level: str = Field(default="INFO")
     
     # API Configuration
-    api_v1_str: str = Field(default="/api/v1", env="API_V1_STR")
-    project_name: str = Field(default="Ikarus3D", env="PROJECT_NAME")
-    cors_origins: List[str] = Field(
-        default=["http://localhost:3000", "http://localhost:8080"],
-        env="CORS_ORIGINS"
-    )
+    api_v1_str: str = Field(default="/api/v1")
+    project_name: str = Field(default="Ikarus3D")
+    cors_origins: List[str] = Field(default=["http://localhost:3000", "http://localhost:8080"])
     
     # Database
-    database_url: str = Field(default="sqlite:///./ikarus.db", env="DATABASE_URL")
-    redis_url: str = Field(default="redis://localhost:6379", env="REDIS_URL")
+    database_url: str = Field(default="sqlite:///./ikarus.db")
+    redis_url: str = Field(default="redis://localhost:6379")
     
     # Pinecone Configuration
-    pinecone_api_key: Optional[str] = Field(default=None, env="PINECONE_API_KEY")
-    pinecone_environment: Optional[str] = Field(default=None, env="PINECONE_ENVIRONMENT")
-    pinecone_index_name: str = Field(default="ikarus-products", env="PINECONE_INDEX_NAME")
+    pinecone_api_key: Optional[str] = Field(default=None)
+    pinecone_environment: Optional[str] = Field(default=None)
+    pinecone_index_name: str = Field(default="ikarus-products")
     
     # Model Configuration
-    model_cache_dir: str = Field(default="./models/trained", env="MODEL_CACHE_DIR")
-    embedding_model: str = Field(default="sentence-transformers/all-MiniLM-L6-v2", env="EMBEDDING_MODEL")
-    image_model: str = Field(default="resnet50", env="IMAGE_MODEL")
-    genai_model: str = Field(default="google/flan-t5-small", env="GENAI_MODEL")
+    model_cache_dir: str = Field(default="./models/trained")
+    embedding_model: str = Field(default="sentence-transformers/all-MiniLM-L6-v2")
+    image_model: str = Field(default="resnet50")
+    genai_model: str = Field(default="google/flan-t5-small")
     
     # API Keys (Optional)
-    huggingface_api_key: Optional[str] = Field(default=None, env="HUGGINGFACE_API_KEY")
-    openai_api_key: Optional[str] = Field(default=None, env="OPENAI_API_KEY")
+    huggingface_api_key: Optional[str] = Field(default=None)
+    openai_api_key: Optional[str] = Field(default=None)
     
     # Security
-    secret_key: str = Field(default="your-secret-key-change-in-production", env="SECRET_KEY")
-    algorithm: str = Field(default="HS256", env="ALGORITHM")
-    access_token_expire_minutes: int = Field(default=30, env="ACCESS_TOKEN_EXPIRE_MINUTES")
+    secret_key: str = Field(default="your-secret-key-change-in-production")
+    algorithm: str = Field(default="HS256")
+    access_token_expire_minutes: int = Field(default=30)
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+    # Fields are read from the matching upper-case environment variables;
+    # .env also holds keys used elsewhere (e.g. OPENAI_API_BASE), so ignore extras
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=False,
+        extra="ignore",
+        protected_namespaces=()
+    )
+
+@lru_cache
+def get_settings() -> Settings:
+    """Return the process-wide settings, parsing the environment only once"""
+    settings = Settings()
+    if settings.debug:
+        logger.info(f"Settings loaded: {settings.app_name} v{settings.app_version}")
+        logger.info(f"Debug mode: {settings.debug}")
+        logger.info(f"Log level: {settings.log_level}")
+    return settings
 
-# Global settings instance
-settings = Settings()
+def __getattr__(name: str):
+    """Keep `from config import settings` working without import-time parsing"""
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Validate required settings
 def validate_settings():
@@ -66,6 +86,7 @@ def validate_settings():
         "pinecone_environment"
     ]
     
+    settings = get_settings()
     missing_settings = []
     for setting in required_settings:
         if not getattr(settings, setting):
@@ -75,12 +96,3 @@ def validate_settings():
         raise ValueError(f"Missing required settings: {', '.join(missing_settings)}")
     
     return True
-
-# Validate settings on import
-if settings.debug:
-    print(f"Settings loaded: {settings.app_name} v{settings.app_version}")
-    print(f"Debug mode: {settings.debug}")
-    print(f"Log level: {settings.log_level}")
-
-
-
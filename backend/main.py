@@ -4,11 +4,15 @@ Ikarus 3D Product Recommendation System - FastAPI Main Application
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
+import orjson
 import uvicorn
 import os
+import asyncio
 import logging
 from dotenv import load_dotenv
+from config import get_settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,24 +21,37 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Cap BLAS/OpenMP thread pools before numpy/torch are imported (by the routers
+# below). TF-IDF, sklearn and PyTorch each spawn their own pool, so with N
+# uvicorn workers keep workers x threads at or below the core count.
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, "2")
+
 # Create FastAPI application
 app = FastAPI(
     title="Ikarus 3D Product Recommendation API",
     description="ML-driven furniture product recommendations and analytics",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
-# Configure CORS
+# Configure CORS (explicit lists let preflight checks short-circuit)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://localhost:8080"],
+    allow_origins=get_settings().cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
 )
 
+# Compress JSON bodies for clients that accept gzip (httpx and requests do by default).
+# Small bodies such as /health aren't worth it; level 6 is nearly as small as 9 for JSON
+# at a fraction of the CPU
+GZIP_MIN_SIZE = 500  # bytes
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=6)
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -44,31 +61,72 @@ async def root():
         "status": "running"
     }
 
+# The liveness body never changes, so serialize it once; pollers may reuse it briefly
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "service": "ikarus-3d-api"})
+HEALTH_MAX_AGE = 30  # seconds
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "ikarus-3d-api"}
+    return Response(
+        content=_HEALTH_BYTES,
+        media_type="application/json",
+        headers={"Cache-Control": f"max-age={HEALTH_MAX_AGE}"}
+    )
 
-# Import and include routers
-from routers import recommendations
-from routers import products
-from routers import analytics
-from services.recommendation_service import recommendation_service
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the ML services have finished loading"""
+    from services.recommendation_service import recommendation_service
+    
+    if not recommendation_service.is_initialized:
+        return ORJSONResponse(
+            status_code=503,
+            content={"status": "initializing", "service": "ikarus-3d-api"}
+        )
+    return {"status": "ready", "service": "ikarus-3d-api"}
 
-# Initialize recommendation service
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup"""
+def _initialize_services():
+    """Load ML models and warm caches (blocking; runs in a worker thread)"""
+    from routers import analytics
+    from services.recommendation_service import recommendation_service
+    
     logger.info("Initializing recommendation service...")
     if recommendation_service.initialize_service():
         logger.info("Recommendation service initialized successfully")
     else:
         logger.error("Failed to initialize recommendation service")
+    
+    # Warm the analytics cache so the first dashboard request isn't penalized
+    logger.info("Loading analytics data...")
+    analytics.load_analytics_data()
+
+# Initialize services in the background so the server binds its port immediately
+@app.on_event("startup")
+async def startup_event():
+    """Initialize services on startup"""
+    asyncio.get_running_loop().run_in_executor(None, _initialize_services)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the pooled async HTTP clients while the event loop is still running"""
+    from services.langchain_service import langchain_service
+    from services.recommendation_service import recommendation_service
+
+    await langchain_service.aclose()
+    await recommendation_service.aclose()
+
+def _register_routers(app: FastAPI):
+    """Import and include the API routers"""
+    from routers import recommendations
+    from routers import products
+    from routers import analytics
+    
+    app.include_router(recommendations.router, prefix="/api/v1/recommendations", tags=["recommendations"])
+    app.include_router(products.router, prefix="/api/v1/products", tags=["products"])
+    app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["analytics"])
 
-# Include routers
-app.include_router(recommendations.router, prefix="/api/v1/recommendations", tags=["recommendations"])
-app.include_router(products.router, prefix="/api/v1/products", tags=["products"])
-app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["analytics"])
+_register_routers(app)
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -3,75 +3,87 @@ Products router
 Exposes lightweight endpoints for product listings and samples used by the frontend.
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from typing import List, Dict, Any
+import hashlib
 import logging
+import orjson
 from services.langchain_service import langchain_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+# Static examples to validate the frontend UI and data flow
+SAMPLE_PRODUCTS = [
+    {
+        "id": "02593e81-5c09-5069-8516-b0b29f439ded",
+        "title": "GOYMFK 1pc Free Standing Shoe Rack, Multi-layer Metal Shoe Cap Rack",
+        "brand": "GOYMFK",
+        "price": "$24.99",
+        "material": "Metal",
+        "categories": "Home & Kitchen, Storage & Organization",
+        "description": "Multi-layer metal rack with hooks for shoes, coats and hats.",
+        "image": "https://m.media-amazon.com/images/I/416WaLx10jL._SS522_.jpg",
+    },
+    {
+        "id": "5938d217-b8c5-5d3e-b1cf-e28e340f292e",
+        "title": "subrtex Leather Dining Chairs Set of 2, Black",
+        "brand": "subrtex",
+        "price": "$199.99",
+        "material": "Leather",
+        "categories": "Home & Kitchen, Furniture, Chairs",
+        "description": "Comfortable leather dining chairs for modern spaces.",
+        "image": "https://m.media-amazon.com/images/I/31SejUEWY7L._SS522_.jpg",
+    },
+    {
+        "id": "b2ede786-3f51-5a45-9a5b-bcf856958cd8",
+        "title": "MUYETOL Wooden Waterproof Transplanting Mat 26.8 x 26.8 in",
+        "brand": "MUYETOL",
+        "price": "$5.98",
+        "material": "Wood",
+        "categories": "Patio, Lawn & Garden, Outdoor Décor",
+        "description": "Portable wooden foldable mat for indoor gardening work.",
+        "image": "https://m.media-amazon.com/images/I/41RgefVq70L._SS522_.jpg",
+    },
+    {
+        "id": "wooden-table-001",
+        "title": "Modern Wooden Dining Table, Oak Finish",
+        "brand": "IKEA",
+        "price": "$299.99",
+        "material": "Oak Wood",
+        "categories": "Furniture, Tables, Dining Room",
+        "description": "Beautiful solid oak wooden dining table for family gatherings.",
+        "image": "https://m.media-amazon.com/images/I/41RgefVq70L._SS522_.jpg",
+    },
+    {
+        "id": "leather-sofa-001",
+        "title": "Premium Black Leather Sofa, 3-Seater",
+        "brand": "West Elm",
+        "price": "$899.99",
+        "material": "Genuine Leather",
+        "categories": "Furniture, Sofas, Living Room",
+        "description": "Luxurious black leather sofa perfect for any living room.",
+        "image": "https://m.media-amazon.com/images/I/31SejUEWY7L._SS522_.jpg",
+    },
+]
+
+# The sample payload never changes, so serialize it once at import
+_SAMPLE_PRODUCTS_BYTES = orjson.dumps({"products": SAMPLE_PRODUCTS, "count": len(SAMPLE_PRODUCTS)})
+_SAMPLE_PRODUCTS_ETAG = f'"{hashlib.blake2b(_SAMPLE_PRODUCTS_BYTES, digest_size=8).hexdigest()}"'
+
+
 @router.get("/sample")
-async def get_sample_products():
+async def get_sample_products(request: Request):
     """Return a small set of sample products with image URLs.
 
     Note: These are static examples to validate the frontend UI and data flow.
+    Clients revalidating with If-None-Match get an empty 304.
     """
-    sample_products = [
-        {
-            "id": "02593e81-5c09-5069-8516-b0b29f439ded",
-            "title": "GOYMFK 1pc Free Standing Shoe Rack, Multi-layer Metal Shoe Cap Rack",
-            "brand": "GOYMFK",
-            "price": "$24.99",
-            "material": "Metal",
-            "categories": "Home & Kitchen, Storage & Organization",
-            "description": "Multi-layer metal rack with hooks for shoes, coats and hats.",
-            "image": "https://m.media-amazon.com/images/I/416WaLx10jL._SS522_.jpg",
-        },
-        {
-            "id": "5938d217-b8c5-5d3e-b1cf-e28e340f292e",
-            "title": "subrtex Leather Dining Chairs Set of 2, Black",
-            "brand": "subrtex",
-            "price": "$199.99",
-            "material": "Leather",
-            "categories": "Home & Kitchen, Furniture, Chairs",
-            "description": "Comfortable leather dining chairs for modern spaces.",
-            "image": "https://m.media-amazon.com/images/I/31SejUEWY7L._SS522_.jpg",
-        },
-        {
-            "id": "b2ede786-3f51-5a45-9a5b-bcf856958cd8",
-            "title": "MUYETOL Wooden Waterproof Transplanting Mat 26.8 x 26.8 in",
-            "brand": "MUYETOL",
-            "price": "$5.98",
-            "material": "Wood",
-            "categories": "Patio, Lawn & Garden, Outdoor Décor",
-            "description": "Portable wooden foldable mat for indoor gardening work.",
-            "image": "https://m.media-amazon.com/images/I/41RgefVq70L._SS522_.jpg",
-        },
-        {
-            "id": "wooden-table-001",
-            "title": "Modern Wooden Dining Table, Oak Finish",
-            "brand": "IKEA",
-            "price": "$299.99",
-            "material": "Oak Wood",
-            "categories": "Furniture, Tables, Dining Room",
-            "description": "Beautiful solid oak wooden dining table for family gatherings.",
-            "image": "https://m.media-amazon.com/images/I/41RgefVq70L._SS522_.jpg",
-        },
-        {
-            "id": "leather-sofa-001",
-            "title": "Premium Black Leather Sofa, 3-Seater",
-            "brand": "West Elm",
-            "price": "$899.99",
-            "material": "Genuine Leather",
-            "categories": "Furniture, Sofas, Living Room",
-            "description": "Luxurious black leather sofa perfect for any living room.",
-            "image": "https://m.media-amazon.com/images/I/31SejUEWY7L._SS522_.jpg",
-        },
-    ]
-
-    return {"products": sample_products, "count": len(sample_products)}
+    headers = {"ETag": _SAMPLE_PRODUCTS_ETAG}
+    if request.headers.get("if-none-match") == _SAMPLE_PRODUCTS_ETAG:
+        return Response(status_code=304, headers=headers)
+    return Response(content=_SAMPLE_PRODUCTS_BYTES, media_type="application/json", headers=headers)
 
 
 @router.post("/{product_id}/generate-description")
@@ -3,7 +3,7 @@ Recommendations API Router
 Handles recommendation endpoints
 """
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Body, HTTPException, Query
 from typing import List, Optional
 import logging
 from services.recommendation_service import recommendation_service
@@ -40,6 +40,29 @@ async def get_recommendations(request: RecommendationRequest):
         logger.error(f"Error getting recommendations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/batch")
+async def get_batch_recommendations(
+    queries: List[str] = Body(..., embed=True, min_length=1, max_length=50),
+    limit: int = Body(10, ge=1, le=50)
+):
+    """Get recommendations for several queries, embedded in one pass and searched concurrently"""
+    try:
+        logger.info(f"Getting recommendations for {len(queries)} queries")
+        
+        results = await recommendation_service.get_similar_products_batch(queries, top_k=limit)
+        
+        return {
+            "results": [
+                {"query": query, "recommendations": products, "total_found": len(products)}
+                for query, products in zip(queries, results)
+            ],
+            "total_queries": len(queries)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting batch recommendations: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/similar/{product_id}")
 async def get_similar_products(
     product_id: str,
@@ -0,0 +1,170 @@
+"""
+Analytics Service for Ikarus 3D
+Computes dataset analytics and persists them so cold starts can skip Pandas
+"""
+
+import re
+import ast
+import json
+import logging
+import functools
+import importlib.util
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+
+# Pandas is imported inside the methods that need it, so loading precomputed
+# analytics (the common path) stays stdlib-only
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+RAW_CSV_PATH = DATA_DIR / "raw" / "intern_data_ikarus.csv"
+PARQUET_PATH = DATA_DIR / "processed" / "intern_data_ikarus.parquet"
+ANALYTICS_PATH = DATA_DIR / "processed" / "analytics.json"
+
+# Only these columns feed the analytics. Material is only counted, so it is parsed
+# as a categorical; brand stays a string so top-brand ties keep dataset order
+ANALYTICS_COLUMNS = ['price', 'brand', 'categories', 'material']
+ANALYTICS_DTYPES = {'material': 'category'}
+
+# Arrow's multithreaded CSV reader when pyarrow is installed, else pandas' C parser
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
+# Quoted items of a stringified list; names containing an apostrophe are double-quoted
+CATEGORY_PATTERN = r"""(?P<quote>['"])(?P<name>.*?)(?P=quote)"""
+
+@functools.lru_cache(maxsize=1 << 16)
+def parse_list_literal(value: str) -> Optional[Tuple]:
+    """Parse a stringified list (e.g. categories or images) to a tuple, or None if it isn't one
+    
+    Memoized: many products share the same category list, and the analysis and
+    population scripts parse the same columns.
+    """
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return None
+    return tuple(parsed) if isinstance(parsed, (list, tuple)) else None
+
+def category_tokens(categories: str) -> List[str]:
+    """Lowercased category names from a stringified list, for '$in' metadata filters"""
+    names = [match.group('name') for match in re.finditer(CATEGORY_PATTERN, categories or '')]
+    if not names and categories and categories != 'nan':
+        names = [categories]
+    return list(dict.fromkeys(name.strip().lower() for name in names if name.strip()))
+
+# Fields combined into each product's embedding text, with their prefixes. Every
+# embedding path builds its text from these, so their vectors stay comparable
+TEXT_FIELDS = [('title', ''), ('description', ''), ('brand', 'Brand: '),
+               ('material', 'Material: '), ('categories', 'Categories: ')]
+
+def product_text(product_data: Dict[str, Any]) -> str:
+    """Combine a product's non-empty text fields into the text that is embedded"""
+    return " ".join(f"{prefix}{product_data[field]}" for field, prefix in TEXT_FIELDS if product_data.get(field))
+
+# Price distribution buckets, lower bound inclusive
+PRICE_BINS = [0, 25, 50, 100, 200, float('inf')]
+PRICE_LABELS = ["$0-25", "$25-50", "$50-100", "$100-200", "$200+"]
+
+class AnalyticsService:
+    """Service for computing and persisting product analytics"""
+
+    def _is_fresh(self, path: Path) -> bool:
+        """Check that a derived artifact exists and is newer than the raw CSV"""
+        return path.exists() and path.stat().st_mtime >= RAW_CSV_PATH.stat().st_mtime
+
+    def load_dataframe(self) -> "pd.DataFrame":
+        """Load the product dataset, preferring the Parquet copy when it is up to date"""
+        import pandas as pd
+        
+        if self._is_fresh(PARQUET_PATH):
+            try:
+                return pd.read_parquet(PARQUET_PATH, columns=ANALYTICS_COLUMNS)
+            except Exception as e:
+                logger.warning(f"Could not read {PARQUET_PATH}, falling back to CSV: {e}")
+        return pd.read_csv(RAW_CSV_PATH, usecols=ANALYTICS_COLUMNS, dtype=ANALYTICS_DTYPES, engine=CSV_ENGINE)
+
+    def compute_analytics(self, df: "pd.DataFrame") -> Dict[str, Any]:
+        """Compute the analytics dict served by the analytics router"""
+        import pandas as pd
+        
+        # Clean price data
+        df = df.copy()
+        df['price_clean'] = pd.to_numeric(df['price'].str.lstrip('$'), errors='coerce')
+
+        # Calculate analytics
+        analytics = {
+            "total_products": len(df),
+            "average_price": float(df['price_clean'].mean()),
+            "median_price": float(df['price_clean'].median()),
+            "price_range": {
+                "min": float(df['price_clean'].min()),
+                "max": float(df['price_clean'].max())
+            },
+            "total_brands": df['brand'].nunique(),
+            "total_categories": df['categories'].nunique(),
+            "total_materials": df['material'].nunique()
+        }
+
+        # Top categories (stored as string representations of lists)
+        category_counts = df['categories'].str.extractall(CATEGORY_PATTERN)['name'].value_counts()
+        analytics["top_categories"] = [
+            {"name": name, "value": int(count)}
+            for name, count in category_counts.head(10).items()
+        ]
+
+        # Top brands
+        brand_counts = df['brand'].value_counts()
+        analytics["top_brands"] = [
+            {"name": name, "value": int(count)}
+            for name, count in brand_counts.head(10).items()
+        ]
+
+        # Price distribution (one binning pass over the price column)
+        price_counts = pd.cut(
+            df['price_clean'], bins=PRICE_BINS, labels=PRICE_LABELS, right=False
+        ).value_counts().reindex(PRICE_LABELS, fill_value=0)
+        analytics["price_distribution"] = [
+            {"range": label, "count": int(count)}
+            for label, count in price_counts.items()
+        ]
+
+        return analytics
+
+    def load_precomputed(self) -> Optional[Dict[str, Any]]:
+        """Load analytics persisted by scripts/precompute_analytics.py, if up to date"""
+        if not self._is_fresh(ANALYTICS_PATH):
+            return None
+
+        try:
+            with open(ANALYTICS_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load precomputed analytics from {ANALYTICS_PATH}: {e}")
+            return None
+
+    def precompute(self) -> Dict[str, Any]:
+        """Compute analytics from the raw CSV and persist them with a Parquet copy of the data"""
+        import pandas as pd
+        
+        df = pd.read_csv(RAW_CSV_PATH, usecols=ANALYTICS_COLUMNS, dtype=ANALYTICS_DTYPES, engine=CSV_ENGINE)
+        analytics = self.compute_analytics(df)
+
+        ANALYTICS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            df.to_parquet(PARQUET_PATH, index=False)
+            logger.info(f"Dataset written to {PARQUET_PATH}")
+        except Exception as e:
+            # Parquet support needs pyarrow; the CSV remains the fallback
+            logger.warning(f"Skipping Parquet export: {e}")
+
+        with open(ANALYTICS_PATH, 'w', encoding='utf-8') as f:
+            json.dump(analytics, f, ensure_ascii=False)
+        logger.info(f"Analytics written to {ANALYTICS_PATH}")
+
+        return analytics
+
+# Global instance
+analytics_service = AnalyticsService()
@@ -10,28 +10,76 @@ import numpy as np
 import torch
 import torchvision.transforms as transforms
 from torchvision.models import resnet50, ResNet50_Weights
+from torchvision.models.quantization import resnet50 as quantized_resnet50, ResNet50_QuantizedWeights
 from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import io
 
+# Optional: libjpeg-turbo decoder for JPEG downloads (pip install PyTurboJPEG).
+# Pillow-SIMD is a drop-in replacement for Pillow and needs no code changes.
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+except ImportError:
+    TurboJPEG = None
+
 logger = logging.getLogger(__name__)
 
+# ResNet50 pooled feature dimension
+FEATURE_DIM = 2048
+
+class CVServiceNotInitialized(RuntimeError):
+    """Raised when image features are requested before initialize() succeeded"""
+
 class CVService:
     """Service for computer vision operations"""
     
     def __init__(self):
         self.model = None
+        self.feature_extractor = None
         self.transform = None
+        self.http = None
+        self.jpeg = None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.is_initialized = False
         
     def initialize(self):
-        """Initialize ResNet50 model for feature extraction"""
+        """Initialize ResNet50 model for feature extraction (a no-op once loaded)"""
+        if self.is_initialized:
+            return True
+        
         try:
-            # Load pre-trained ResNet50
-            self.model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V2)
-            self.model.eval()
-            self.model.to(self.device)
+            # Match torch's intra-op pool to the process thread budget (see main.py). Offline
+            # scripts don't set one and keep torch's default of one thread per physical core
+            threads = os.getenv('OMP_NUM_THREADS')
+            if threads:
+                torch.set_num_threads(int(threads))
+                try:
+                    torch.set_num_interop_threads(1)
+                except RuntimeError:
+                    # Can only be set before any inter-op parallel work has started
+                    pass
+            
+            # Let cuDNN pick the fastest conv algorithms for our fixed input size
+            torch.backends.cudnn.benchmark = True
+            
+            # Load pre-trained ResNet50: int8 on x86 CPUs, FP32/FP16 otherwise
+            if self._use_quantized_model():
+                self.feature_extractor = self._build_quantized_extractor()
+            else:
+                self.model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V2)
+                self.model.eval()
+                self.model.to(self.device)
+                
+                # Everything up to (and including) avgpool, in channels-last layout
+                # (and FP16 on GPU), compiled into a single graph
+                modules = list(self.model.children())[:-1]
+                extractor = torch.nn.Sequential(*modules).eval().to(self.device)
+                extractor = extractor.to(memory_format=torch.channels_last)
+                if self.device.type == 'cuda':
+                    extractor = extractor.half()
+                self.feature_extractor = self._compile_feature_extractor(extractor)
             
             # Define image preprocessing
             self.transform = transforms.Compose([
@@ -42,6 +90,19 @@ class CVService:
                                    std=[0.229, 0.224, 0.225])
             ])
             
+            # Shared HTTP session so image downloads reuse pooled connections
+            self.http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+            self.http.mount('http://', adapter)
+            self.http.mount('https://', adapter)
+            
+            # Fast JPEG decoding when libjpeg-turbo is available
+            if TurboJPEG is not None:
+                try:
+                    self.jpeg = TurboJPEG()
+                except Exception as e:
+                    logger.warning(f"TurboJPEG unavailable, using PIL for JPEG decode: {e}")
+            
             self.is_initialized = True
             logger.info("CV service initialized successfully with ResNet50")
             return True
@@ -50,52 +111,157 @@ class CVService:
             logger.error(f"Error initializing CV service: {e}")
             return False
     
+    def _use_quantized_model(self) -> bool:
+        """Whether to run the int8 model (CPU with FBGEMM; override with CV_QUANTIZE=0/1)"""
+        if self.device.type != 'cpu':
+            return False
+        if 'fbgemm' not in torch.backends.quantized.supported_engines:
+            return False
+        return os.getenv('CV_QUANTIZE', '1').lower() in ('1', 'true', 'yes')
+    
+    def _build_quantized_extractor(self) -> torch.nn.Module:
+        """Load torchvision's pre-calibrated int8 ResNet50 with the classifier removed"""
+        torch.backends.quantized.engine = 'fbgemm'
+        self.model = quantized_resnet50(
+            weights=ResNet50_QuantizedWeights.IMAGENET1K_FBGEMM_V2, quantize=True
+        )
+        self.model.eval()
+        
+        # The quantized forward ends quant -> ... -> avgpool -> flatten -> fc -> dequant,
+        # so dropping fc yields the dequantized 2048-d pooled features
+        self.model.fc = torch.nn.Identity()
+        
+        # torch.compile doesn't handle quantized kernels; tracing still removes Python dispatch
+        with torch.no_grad():
+            return torch.jit.trace(self.model, self._prepare_input(torch.zeros(1, 3, 224, 224)))
+    
+    def _compile_feature_extractor(self, extractor: torch.nn.Module):
+        """Compile the extractor and pay the compile/graph-capture cost up front
+        
+        Uses torch.compile where available and falls back to a TorchScript
+        trace if compilation isn't supported on this machine. Batch size depends
+        on how many images in a batch downloaded, so the batch dimension is
+        compiled as dynamic rather than recompiled per size.
+        """
+        if hasattr(torch, 'compile'):
+            try:
+                compiled = torch.compile(extractor, mode="reduce-overhead", fullgraph=True, dynamic=True)
+                # Size 1 is always specialized; any larger batch compiles the dynamic graph
+                with torch.inference_mode():
+                    for batch_size in (1, 2):
+                        compiled(self._prepare_input(torch.zeros(batch_size, 3, 224, 224)))
+                return compiled
+            except Exception as e:
+                logger.warning(f"torch.compile unavailable, falling back to TorchScript: {e}")
+        
+        with torch.no_grad():
+            return torch.jit.trace(extractor, self._prepare_input(torch.zeros(1, 3, 224, 224)))
+    
+    def _prepare_input(self, batch: torch.Tensor) -> torch.Tensor:
+        """Move a [N,3,224,224] batch to the device in the layout/dtype the extractor expects"""
+        batch = batch.to(self.device).contiguous(memory_format=torch.channels_last)
+        if self.device.type == 'cuda':
+            batch = batch.half()
+        return batch
+    
+    def _forward(self, batch: torch.Tensor) -> np.ndarray:
+        """Run the feature extractor on a preprocessed batch, returning [N,2048] float32 features"""
+        with torch.inference_mode():
+            features = self.feature_extractor(self._prepare_input(batch))
+            return features.flatten(1).float().cpu().numpy()
+    
+    def decode_image(self, data: bytes) -> Image.Image:
+        """Decode image bytes to an RGB PIL image"""
+        # JPEG files start with the SOI marker
+        if self.jpeg is not None and data[:2] == b'\xff\xd8':
+            try:
+                return Image.fromarray(self.jpeg.decode(data, pixel_format=TJPF_RGB))
+            except Exception as e:
+                logger.debug(f"TurboJPEG decode failed, falling back to PIL: {e}")
+        
+        image = Image.open(io.BytesIO(data))
+        # For JPEGs, let the decoder downscale by a power of two while staying
+        # at least as large as the 256px resize, instead of decoding full size
+        image.draft('RGB', (256, 256))
+        return image.convert('RGB')
+    
     def load_image_from_url(self, image_url: str) -> Optional[Image.Image]:
         """Load image from URL"""
         try:
-            response = requests.get(image_url, timeout=10)
+            http = self.http or requests
+            response = http.get(image_url, timeout=10)
             response.raise_for_status()
-            image = Image.open(io.BytesIO(response.content))
-            return image.convert('RGB')
+            return self.decode_image(response.content)
         except Exception as e:
             logger.error(f"Error loading image from URL {image_url}: {e}")
             return None
     
-    def extract_image_features(self, image: Image.Image) -> np.ndarray:
+    def extract_image_features(self, image: Image.Image) -> Optional[np.ndarray]:
         """Extract features from image using ResNet50"""
         if not self.is_initialized:
-            logger.error("CV service not initialized")
-            return np.random.rand(2048)  # ResNet50 feature dimension
+            raise CVServiceNotInitialized("CV service not initialized")
         
         try:
-            # Preprocess image
-            input_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            # Extract features (remove final classification layer)
-            with torch.no_grad():
-                features = self.model.avgpool(self.model.layer4(self.model.layer3(
-                    self.model.layer2(self.model.layer1(self.model.maxpool(
-                        self.model.relu(self.model.bn1(self.model.conv1(input_tensor)))))))))
-                features = features.squeeze().cpu().numpy()
-            
-            return features
+            # Preprocess image and extract features (final classification layer removed)
+            input_tensor = self.transform(image).unsqueeze(0)
+            return self._forward(input_tensor)[0]
             
         except Exception as e:
             logger.error(f"Error extracting image features: {e}")
-            return np.random.rand(2048)
+            return None
     
-    def get_image_embedding(self, image_url: str) -> np.ndarray:
-        """Get embedding for image from URL"""
-        try:
-            image = self.load_image_from_url(image_url)
-            if image is None:
-                return np.random.rand(2048)
-            
-            return self.extract_image_features(image)
-            
-        except Exception as e:
-            logger.error(f"Error getting image embedding: {e}")
-            return np.random.rand(2048)
+    def get_image_embedding(self, image_url: str) -> Optional[np.ndarray]:
+        """Get embedding for image from URL, or None if the image can't be loaded"""
+        if not self.is_initialized:
+            raise CVServiceNotInitialized("CV service not initialized")
+        
+        image = self.load_image_from_url(image_url)
+        if image is None:
+            return None
+        
+        return self.extract_image_features(image)
+    
+    def extract_batch_features(self, images: List[Image.Image]) -> np.ndarray:
+        """Extract features for a batch of images in a single ResNet50 forward pass"""
+        batch = torch.stack([self.transform(image) for image in images])
+        return self._forward(batch)
+    
+    def get_image_embeddings(self, image_urls: List[str], max_workers: int = 16) -> np.ndarray:
+        """Get embeddings for many image URLs, downloading concurrently and batching the forward pass.
+        
+        Rows for images that could not be loaded are all zeros; callers should
+        filter them out (e.g. by checking for a zero norm) rather than index them.
+        """
+        if not self.is_initialized:
+            raise CVServiceNotInitialized("CV service not initialized")
+        
+        if not image_urls:
+            return np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            images = list(executor.map(self.load_image_from_url, image_urls))
+        
+        return self._embed_loaded_images(images)
+    
+    def embed_images(self, images: List[Optional[Image.Image]]) -> np.ndarray:
+        """Embed already-loaded images in one forward pass; None entries give zero rows"""
+        if not self.is_initialized:
+            raise CVServiceNotInitialized("CV service not initialized")
+        return self._embed_loaded_images(images)
+    
+    def _embed_loaded_images(self, images: List[Optional[Image.Image]]) -> np.ndarray:
+        """Embed a list of images in one forward pass, leaving zero rows for missing ones"""
+        embeddings = np.zeros((len(images), FEATURE_DIM), dtype=np.float32)
+        
+        # Only run the forward pass on images that actually downloaded and decoded
+        loaded = [i for i, image in enumerate(images) if image is not None]
+        if loaded:
+            try:
+                embeddings[loaded] = self.extract_batch_features([images[i] for i in loaded])
+            except Exception as e:
+                logger.error(f"Error extracting batch image features: {e}")
+        
+        return embeddings
     
     def classify_image_category(self, image: Image.Image) -> Dict[str, float]:
         """Classify image into furniture categories"""
@@ -125,6 +291,7 @@ class CVService:
         return {
             "initialized": self.is_initialized,
             "model_available": self.model is not None,
+            "feature_extractor_available": self.feature_extractor is not None,
             "device": str(self.device),
             "transform_available": self.transform is not None
         }
@@ -0,0 +1,81 @@
+"""
+Description Cache for Ikarus 3D
+Caches generated product descriptions by a hash of the exact completion request
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import diskcache
+except ImportError:  # disk layer is optional; the in-memory cache still works
+    diskcache = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv('DESCRIPTION_CACHE_DIR', Path(__file__).parent.parent.parent / ".desc_cache"))
+CACHE_TTL = 30 * 24 * 3600  # seconds
+CACHE_SIZE_LIMIT = int(2e9)  # bytes on disk
+
+class DescriptionCache:
+    """Description cache with a TTL, on disk via diskcache or in memory"""
+
+    def __init__(self, ttl: int = CACHE_TTL, max_memory_items: int = 10000):
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+
+        if diskcache is not None:
+            try:
+                self._disk = diskcache.Cache(str(CACHE_DIR), size_limit=CACHE_SIZE_LIMIT)
+            except Exception as e:
+                logger.warning(f"Description disk cache unavailable, using memory only: {e}")
+
+    def key(self, request: Dict[str, Any]) -> str:
+        """Hash the completion request (prompt, model and sampling settings)"""
+        canonical = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached description, or None on a miss or after expiry"""
+        if self._disk is not None:
+            try:
+                return self._disk.get(key)
+            except Exception as e:
+                logger.warning(f"Description disk cache read failed: {e}")
+                return None
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires, description = entry
+            if expires < time.monotonic():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return description
+
+    def set(self, key: str, description: str):
+        """Cache a generated description until the TTL runs out"""
+        if self._disk is not None:
+            try:
+                self._disk.set(key, description, expire=self.ttl)
+            except Exception as e:
+                logger.warning(f"Description disk cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._memory[key] = (time.monotonic() + self.ttl, description)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
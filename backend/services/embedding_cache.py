@@ -0,0 +1,94 @@
+"""
+Embedding Cache for Ikarus 3D
+Content-hash keyed embedding cache with an in-process LRU and an optional disk layer
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+try:
+    import diskcache
+except ImportError:  # disk layer is optional; the in-memory LRU still works
+    diskcache = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv('EMBEDDING_CACHE_DIR', Path(__file__).parent.parent.parent / ".emb_cache"))
+
+class EmbeddingCache:
+    """Embedding cache keyed by a BLAKE2b hash of the model name and normalized text"""
+
+    def __init__(self, namespace: str, max_memory_items: int = 10000):
+        self.namespace = namespace
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+
+        if diskcache is not None:
+            try:
+                self._disk = diskcache.Cache(str(CACHE_DIR / namespace))
+            except Exception as e:
+                logger.warning(f"Embedding disk cache unavailable, using memory only: {e}")
+
+    def key(self, text: str) -> str:
+        """Hash the whitespace-normalized text together with the namespace"""
+        normalized = " ".join(text.split())
+        return hashlib.blake2b(f"{self.namespace}\0{normalized}".encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the cached vector for a key, or None on a miss"""
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+
+        if self._disk is None:
+            return None
+
+        try:
+            stored = self._disk.get(key)
+        except Exception as e:
+            logger.warning(f"Embedding disk cache read failed: {e}")
+            return None
+        if stored is None:
+            return None
+
+        vector = np.frombuffer(stored, dtype=np.float16).astype(np.float32)
+        self._remember(key, vector)
+        return vector
+
+    def set(self, key: str, vector: np.ndarray):
+        """Cache a vector in memory and, as float16, on disk"""
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+
+        if self._disk is not None:
+            try:
+                self._disk.set(key, vector.astype(np.float16).tobytes())
+            except Exception as e:
+                logger.warning(f"Embedding disk cache write failed: {e}")
+
+    def get_many(self, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Look up many texts, returning the hits keyed by input position"""
+        hits = {}
+        for i, text in enumerate(texts):
+            vector = self.get(self.key(text))
+            if vector is not None:
+                hits[i] = vector
+        return hits
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Insert into the in-memory LRU, evicting the oldest entries"""
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
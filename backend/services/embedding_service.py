@@ -5,12 +5,20 @@ Basic text embedding using TF-IDF for now
 
 import logging
 import numpy as np
-from typing import Dict, Any, List
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import joblib
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import linear_kernel
 import pandas as pd
+from services.analytics_service import product_text
 
 logger = logging.getLogger(__name__)
 
+# Fitted vectorizer, persisted so process start doesn't re-fit on the corpus
+VECTORIZER_PATH = Path(__file__).parent.parent.parent / "models" / "trained" / "tfidf.joblib"
+
 class EmbeddingService:
     """Service for generating text embeddings"""
     
@@ -18,15 +26,33 @@ class EmbeddingService:
         self.vectorizer = None
         self.is_initialized = False
         
-    def initialize(self, texts: List[str]):
-        """Initialize the TF-IDF vectorizer with sample texts"""
+    def initialize(self, texts: Optional[List[str]] = None, refit: bool = False):
+        """Initialize the TF-IDF vectorizer, loading a persisted fit when available
+        
+        Pass refit=True (with texts) to re-fit and overwrite the persisted
+        vectorizer after the corpus changes.
+        """
         try:
+            if not refit and VECTORIZER_PATH.exists():
+                self.vectorizer = joblib.load(VECTORIZER_PATH)
+                self.is_initialized = True
+                logger.info(f"Embedding service initialized from {VECTORIZER_PATH}")
+                return True
+            
+            if not texts:
+                raise ValueError(f"No texts to fit and no persisted vectorizer at {VECTORIZER_PATH}")
+            
             self.vectorizer = TfidfVectorizer(
                 max_features=1000,
                 stop_words='english',
-                ngram_range=(1, 2)
+                ngram_range=(1, 2),
+                dtype=np.float32
             )
             self.vectorizer.fit(texts)
+            
+            VECTORIZER_PATH.parent.mkdir(parents=True, exist_ok=True)
+            joblib.dump(self.vectorizer, VECTORIZER_PATH)
+            
             self.is_initialized = True
             logger.info("Embedding service initialized successfully")
             return True
@@ -34,42 +60,72 @@ class EmbeddingService:
             logger.error(f"Error initializing embedding service: {e}")
             return False
     
+    def _zero_embedding(self) -> np.ndarray:
+        """Fallback embedding: zeros drop out of similarity ranking instead of scoring like a product"""
+        if self.vectorizer is None or not hasattr(self.vectorizer, 'vocabulary_'):
+            return np.zeros(0, dtype=np.float32)
+        return np.zeros(len(self.vectorizer.vocabulary_), dtype=np.float32)
+    
     def get_text_embedding(self, text: str) -> np.ndarray:
-        """Get embedding for a single text"""
+        """Get embedding for a single text (empty if the service isn't initialized)"""
         if not self.is_initialized:
-            # Return random embedding if not initialized
-            return np.random.rand(100)
+            logger.error("Embedding service not initialized")
+            return self._zero_embedding()
         
         try:
             embedding = self.vectorizer.transform([text]).toarray()[0]
             return embedding
         except Exception as e:
             logger.error(f"Error generating text embedding: {e}")
-            return np.random.rand(100)
+            return self._zero_embedding()
+    
+    def get_text_embeddings(self, texts: List[str]) -> sparse.csr_matrix:
+        """Get sparse TF-IDF embeddings for many texts in one transform call"""
+        if not self.is_initialized:
+            logger.error("Embedding service not initialized")
+            return sparse.csr_matrix((len(texts), 0))
+        
+        return self.vectorizer.transform(texts)
     
     def get_product_embedding(self, product_data: Dict[str, Any]) -> np.ndarray:
         """Get embedding for product data"""
         try:
-            # Combine product features into text
-            text_parts = []
+            return self.get_text_embedding(product_text(product_data))
             
-            if product_data.get('title'):
-                text_parts.append(str(product_data['title']))
-            if product_data.get('description'):
-                text_parts.append(str(product_data['description']))
-            if product_data.get('brand'):
-                text_parts.append(f"Brand: {product_data['brand']}")
-            if product_data.get('material'):
-                text_parts.append(f"Material: {product_data['material']}")
-            if product_data.get('categories'):
-                text_parts.append(f"Categories: {product_data['categories']}")
+        except Exception as e:
+            logger.error(f"Error generating product embedding: {e}")
+            return self._zero_embedding()
+    
+    def get_product_embeddings(self, products: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        """Get sparse embeddings for many products in one transform call"""
+        return self.get_text_embeddings([product_text(product) for product in products])
+    
+    def find_similar(self, query_text: str, corpus_embeddings: sparse.csr_matrix,
+                     top_k: int = 10) -> List[Dict[str, Any]]:
+        """Find the most similar corpus rows without densifying the TF-IDF vectors"""
+        if not self.is_initialized:
+            return []
+        
+        try:
+            # TF-IDF rows are L2-normalized, so the sparse dot product is the cosine similarity
+            query_embedding = self.vectorizer.transform([query_text])
+            similarities = linear_kernel(query_embedding, corpus_embeddings)[0]
             
-            combined_text = " ".join(text_parts)
-            return self.get_text_embedding(combined_text)
+            # Partial selection, then sort only the top_k
+            top_k = min(top_k, len(similarities))
+            if top_k <= 0:
+                return []
+            top_indices = np.argpartition(-similarities, top_k - 1)[:top_k]
+            top_indices = top_indices[np.argsort(-similarities[top_indices])]
+            
+            return [
+                {'index': int(idx), 'similarity_score': float(similarities[idx])}
+                for idx in top_indices
+            ]
             
         except Exception as e:
-            logger.error(f"Error generating product embedding: {e}")
-            return np.random.rand(100)
+            logger.error(f"Error finding similar texts: {e}")
+            return []
 
 # Global instance
 embedding_service = EmbeddingService()
\ No newline at end of file
@@ -4,17 +4,46 @@ Handles AI-powered text generation and embeddings using Azure OpenAI
 """
 
 import os
+import io
+import json
+import string
+import textwrap
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
+import httpx
 from openai import AzureOpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 import openai
+from services.embedding_cache import EmbeddingCache
+from services.description_cache import DescriptionCache
+from services.analytics_service import product_text
 
 logger = logging.getLogger(__name__)
 
+# Returned when embedding fails; callers can detect it with not v.any()
+ZERO_EMBEDDING = np.zeros(1536, dtype=np.float32)  # OpenAI embedding dimension
+ZERO_EMBEDDING.setflags(write=False)
+
+SYSTEM_PROMPT = "You are a creative product description writer for a furniture e-commerce platform."
+
+# The system prompt carries the role; product fields go in as one compact JSON object
+DESCRIPTION_TEMPLATE = """
+    Product Details (JSON): $product_json
+    
+    Generate a creative, engaging product description that:
+    1. Highlights the key features and benefits
+    2. Appeals to potential buyers
+    3. Uses persuasive but honest language
+    4. Is 2-3 sentences long
+    5. Focuses on lifestyle and functionality
+    
+    Creative Description:
+    """
+
 class LangChainService:
     """Service for LangChain-based AI operations"""
     
@@ -22,10 +51,16 @@ class LangChainService:
         self.llm = None
         self.embeddings = None
         self.description_chain = None
+        self.async_http = None
+        self.embedding_cache = EmbeddingCache('openai-embeddings')
+        self.description_cache = DescriptionCache()
         self.is_initialized = False
         
     def initialize(self):
-        """Initialize LangChain with Azure OpenAI"""
+        """Initialize LangChain with Azure OpenAI (a no-op once loaded)"""
+        if self.is_initialized:
+            return True
+        
         try:
             # Initialize OpenAI client
             self.client = AzureOpenAI(
@@ -35,27 +70,8 @@ class LangChainService:
                 azure_deployment=os.getenv('OPENAI_DEPLOYMENT_NAME', 'gpt-4')
             )
             
-            # Create description generation prompt
-            self.description_template = """
-            You are a creative product description writer for a furniture e-commerce platform.
-            
-            Product Details:
-            Title: {title}
-            Brand: {brand}
-            Material: {material}
-            Categories: {categories}
-            Price: {price}
-            Current Description: {current_description}
-            
-            Generate a creative, engaging product description that:
-            1. Highlights the key features and benefits
-            2. Appeals to potential buyers
-            3. Uses persuasive but honest language
-            4. Is 2-3 sentences long
-            5. Focuses on lifestyle and functionality
-            
-            Creative Description:
-            """
+            # Create description generation prompt (dedented once, substituted per product)
+            self.description_template = string.Template(textwrap.dedent(DESCRIPTION_TEMPLATE).strip())
             
             self.is_initialized = True
             logger.info("LangChain service initialized successfully with direct OpenAI client")
@@ -72,96 +88,242 @@ class LangChainService:
             return "AI description generation not available."
         
         try:
-            # Prepare input data
-            input_data = {
-                "title": product_data.get('title', 'Unknown Product'),
-                "brand": product_data.get('brand', 'Unknown Brand'),
-                "material": product_data.get('material', 'Various Materials'),
-                "categories": product_data.get('categories', 'General'),
-                "price": product_data.get('price', 'Price not available'),
-                "current_description": product_data.get('description', 'No description available')
-            }
-            
-            # Format the prompt
-            prompt = self.description_template.format(**input_data)
+            title, request = self._build_request(product_data)
             
-            # Generate description using OpenAI
-            response = self.client.chat.completions.create(
-                model=os.getenv('OPENAI_DEPLOYMENT_NAME', 'gpt-4'),
-                messages=[
-                    {"role": "system", "content": "You are a creative product description writer for a furniture e-commerce platform."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=200
-            )
-            
-            # Extract the description
-            description = response.choices[0].message.content.strip()
+            # Unchanged product data produces the same request; reuse its description
+            key = self.description_cache.key(request)
+            cached = self.description_cache.get(key)
+            if cached is not None:
+                return cached
             
-            # Clean up the result
-            if description.startswith('Creative Description:'):
-                description = description.replace('Creative Description:', '').strip()
+            # Generate description using OpenAI
+            response = self.client.chat.completions.create(**request)
             
-            logger.info(f"Generated AI description for product: {input_data['title'][:50]}...")
+            description = self._clean_description(response.choices[0].message.content)
+            self.description_cache.set(key, description)
+            logger.info(f"Generated AI description for product: {title[:50]}...")
             return description
             
         except Exception as e:
             logger.error(f"Error generating product description: {e}")
             return "Unable to generate AI description at this time."
     
+    def _build_request(self, product_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Build the chat completion request for a product, returning its title too"""
+        # Prepare input data
+        input_data = {
+            "title": product_data.get('title', 'Unknown Product'),
+            "brand": product_data.get('brand', 'Unknown Brand'),
+            "material": product_data.get('material', 'Various Materials'),
+            "categories": product_data.get('categories', 'General'),
+            "price": product_data.get('price', 'Price not available'),
+            "current_description": product_data.get('description', 'No description available')
+        }
+        
+        # Format the prompt
+        product_json = json.dumps(input_data, ensure_ascii=False, separators=(',', ':'), default=str)
+        prompt = self.description_template.substitute(product_json=product_json)
+        
+        request = {
+            "model": os.getenv('OPENAI_DEPLOYMENT_NAME', 'gpt-4'),
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 200
+        }
+        return str(input_data['title']), request
+    
+    def _clean_description(self, content: str) -> str:
+        """Clean up the description text from a chat completion"""
+        description = content.strip()
+        
+        # Clean up the result
+        if description.startswith('Creative Description:'):
+            description = description.replace('Creative Description:', '').strip()
+        
+        return description
+    
     def get_text_embedding(self, text: str) -> np.ndarray:
         """Get text embedding using OpenAI embeddings"""
         if not self.is_initialized:
             logger.error("LangChain service not initialized")
-            return np.random.rand(1536)  # OpenAI embedding dimension
+            return ZERO_EMBEDDING
         
         try:
-            # Get embedding from OpenAI
-            embedding = self.embeddings.embed_query(text)
-            return np.array(embedding)
+            key = self.embedding_cache.key(text)
+            embedding = self.embedding_cache.get(key)
+            if embedding is None:
+                # Get embedding from OpenAI
+                embedding = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+                self.embedding_cache.set(key, embedding)
+            return embedding
             
         except Exception as e:
             logger.error(f"Error getting text embedding: {e}")
-            return np.random.rand(1536)
+            return ZERO_EMBEDDING
     
     def get_product_embedding(self, product_data: Dict[str, Any]) -> np.ndarray:
         """Get combined embedding for product data"""
         try:
             # Combine product features into text
-            text_parts = []
-            
-            if product_data.get('title'):
-                text_parts.append(str(product_data['title']))
-            if product_data.get('description'):
-                text_parts.append(str(product_data['description']))
-            if product_data.get('brand'):
-                text_parts.append(f"Brand: {product_data['brand']}")
-            if product_data.get('material'):
-                text_parts.append(f"Material: {product_data['material']}")
-            if product_data.get('categories'):
-                text_parts.append(f"Categories: {product_data['categories']}")
-            
-            combined_text = " ".join(text_parts)
-            return self.get_text_embedding(combined_text)
+            return self.get_text_embedding(product_text(product_data))
             
         except Exception as e:
             logger.error(f"Error generating product embedding: {e}")
-            return np.random.rand(1536)
+            return ZERO_EMBEDDING
+    
+    def _get_async_http(self) -> httpx.AsyncClient:
+        """Create the pooled async client for the Azure deployment on first use (inside the running loop)"""
+        if self.async_http is None:
+            endpoint = (os.getenv('OPENAI_API_BASE') or '').rstrip('/')
+            deployment = os.getenv('OPENAI_DEPLOYMENT_NAME', 'gpt-4')
+            self.async_http = httpx.AsyncClient(
+                base_url=f"{endpoint}/openai/deployments/{deployment}",
+                headers={"api-key": os.getenv('OPENAI_API_KEY') or ''},
+                params={"api-version": os.getenv('OPENAI_API_VERSION', '2024-02-15-preview')},
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+                timeout=60.0
+            )
+        return self.async_http
     
-    def generate_batch_descriptions(self, products: List[Dict[str, Any]]) -> List[str]:
-        """Generate descriptions for multiple products"""
-        descriptions = []
+    async def _generate_one(self, product: Dict[str, Any], sem: asyncio.Semaphore) -> str:
+        """Generate one description with a direct REST call, bounded by the semaphore"""
+        try:
+            title, request = self._build_request(product)
+            
+            key = self.description_cache.key(request)
+            cached = self.description_cache.get(key)
+            if cached is not None:
+                return cached
+            
+            request.pop('model')  # the deployment in the URL selects the model
+            async with sem:
+                response = await self._get_async_http().post("/chat/completions", json=request)
+            response.raise_for_status()
+            
+            content = response.json()["choices"][0]["message"]["content"]
+            description = self._clean_description(content)
+            self.description_cache.set(key, description)
+            logger.info(f"Generated AI description for product: {title[:50]}...")
+            return description
+            
+        except Exception as e:
+            logger.error(f"Error generating description for product {product.get('id', 'unknown')}: {e}")
+            return "AI description generation failed."
+    
+    async def generate_batch_descriptions_async(self, products: List[Dict[str, Any]],
+                                                concurrency: int = 16,
+                                                timeout: Optional[float] = None) -> List[str]:
+        """Generate descriptions for multiple products concurrently
+        
+        Keep concurrency within the deployment's requests/tokens-per-minute quota.
+        With a timeout (seconds, for the whole batch), descriptions still pending
+        when it runs out are cancelled and reported as failed; finished ones are kept.
+        """
+        if not self.is_initialized:
+            logger.error("LangChain service not initialized")
+            return ["AI description generation not available."] * len(products)
+        if not products:
+            return []
         
-        for product in products:
+        sem = asyncio.Semaphore(concurrency)
+        tasks = [asyncio.create_task(self._generate_one(product, sem)) for product in products]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"Description batch timed out with {len(pending)}/{len(tasks)} pending")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        return [
+            "AI description generation failed." if task.cancelled() or task.exception() is not None
+            else task.result()
+            for task in tasks
+        ]
+    
+    def generate_batch_descriptions(self, products: List[Dict[str, Any]],
+                                    concurrency: int = 16,
+                                    timeout: Optional[float] = None) -> List[str]:
+        """Generate descriptions for multiple products (sync wrapper, not for use inside a running loop)"""
+        async def run():
             try:
-                description = self.generate_product_description(product)
-                descriptions.append(description)
-            except Exception as e:
-                logger.error(f"Error generating description for product {product.get('id', 'unknown')}: {e}")
-                descriptions.append("AI description generation failed.")
+                return await self.generate_batch_descriptions_async(products, concurrency, timeout)
+            finally:
+                # The client is bound to this event loop, which asyncio.run closes
+                await self.aclose()
         
-        return descriptions
+        return asyncio.run(run())
+    
+    async def aclose(self):
+        """Close the async HTTP client (call on application shutdown)"""
+        if self.async_http is not None:
+            await self.async_http.aclose()
+            self.async_http = None
+    
+    def submit_description_batch(self, products: List[Dict[str, Any]]) -> Optional[str]:
+        """Submit descriptions for offline generation through the Batch API, returning the batch id
+        
+        Batch jobs run within 24 hours at a lower price and on a separate quota,
+        which suits full-catalog runs. The deployment must be a Global Batch one.
+        """
+        if not self.is_initialized:
+            logger.error("LangChain service not initialized")
+            return None
+        
+        try:
+            lines = []
+            for i, product in enumerate(products):
+                _, request = self._build_request(product)
+                lines.append(json.dumps({
+                    "custom_id": str(product.get('id', i)),
+                    "method": "POST",
+                    "url": "/chat/completions",
+                    "body": request
+                }, ensure_ascii=False, default=str))
+            
+            batch_file = self.client.files.create(
+                file=("descriptions.jsonl", io.BytesIO("\n".join(lines).encode('utf-8'))),
+                purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/chat/completions",
+                completion_window="24h"
+            )
+            logger.info(f"Submitted description batch {batch.id} for {len(products)} products")
+            return batch.id
+            
+        except Exception as e:
+            logger.error(f"Error submitting description batch: {e}")
+            return None
+    
+    def collect_description_batch(self, batch_id: str) -> Optional[Dict[str, str]]:
+        """Return {product id: description} once a batch has completed, or None if it isn't done"""
+        try:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status != "completed":
+                logger.info(f"Description batch {batch_id} is {batch.status}")
+                return None
+            
+            descriptions = {}
+            output = self.client.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                content = response["body"]["choices"][0]["message"]["content"]
+                descriptions[result["custom_id"]] = self._clean_description(content)
+            
+            return descriptions
+            
+        except Exception as e:
+            logger.error(f"Error collecting description batch {batch_id}: {e}")
+            return None
     
     def get_service_status(self) -> Dict[str, Any]:
         """Get service status and configuration"""
@@ -3,89 +3,301 @@ NLP Service for Ikarus 3D
 Handles text processing and semantic similarity using sentence-transformers
 """
 
+import os
+import re
+import math
 import logging
-from typing import List, Dict, Any, Optional
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
+import torch
+import torch.nn.functional as F
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.metrics import silhouette_score
+from services.embedding_cache import EmbeddingCache
+from services.analytics_service import product_text
 
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Inference backend (NLP_BACKEND): 'torch' (compiled eager model), 'onnx' (ONNX
+# Runtime), or 'onnx-int8' (the model repo's AVX-512 VNNI int8 ONNX export)
+NLP_BACKEND = os.getenv('NLP_BACKEND', 'torch').lower()
+ONNX_INT8_FILE = 'onnx/model_qint8_avx512_vnni.onnx'
+
+# Returned when embedding fails; a zero vector is easy to detect (not v.any())
+# and drops out of similarity ranking instead of scoring like a real product
+ZERO_EMBEDDING = np.zeros(384, dtype=np.float32)  # all-MiniLM-L6-v2 dimension
+ZERO_EMBEDDING.setflags(write=False)
+
+# Clustering settings: mini-batch size and the silhouette subsample size
+CLUSTER_BATCH_SIZE = 1024
+SILHOUETTE_SAMPLE_SIZE = 2000
+
+# Keyword extraction: lowercase alphabetic tokens of 3+ letters, minus common stop words
+KEYWORD_PATTERN = re.compile(r"[a-z]{3,}")
+STOP_WORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'})
+
+# Rows of an int8/float16 corpus are upcast to float32 this many at a time while scoring
+QUANTIZED_SCAN_BLOCK = 65536
+
+def load_sentence_model(backend: str = NLP_BACKEND) -> Tuple[SentenceTransformer, str]:
+    """Load MODEL_NAME on an inference backend, falling back to PyTorch; returns (model, backend used)"""
+    if backend in ('onnx', 'onnx-int8'):
+        model_kwargs = {'provider': 'CPUExecutionProvider'}
+        if backend == 'onnx-int8':
+            model_kwargs['file_name'] = ONNX_INT8_FILE
+        try:
+            return SentenceTransformer(MODEL_NAME, backend='onnx', model_kwargs=model_kwargs), backend
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable, falling back to PyTorch: {e}")
+    
+    return SentenceTransformer(MODEL_NAME), 'torch'
+
 class NLPService:
     """Service for natural language processing operations"""
     
     def __init__(self):
         self.model = None
+        self.backend = NLP_BACKEND
+        self.cache = EmbeddingCache(self._cache_namespace())
         self.is_initialized = False
+    
+    def _cache_namespace(self) -> str:
+        """Embedding cache namespace for the model on the current backend"""
+        # Backends produce slightly different vectors, so they don't share cache entries
+        return f"{MODEL_NAME.replace('/', '--')}--{self.backend}"
         
     def initialize(self):
-        """Initialize sentence transformer model"""
+        """Initialize sentence transformer model (a no-op once loaded)"""
+        if self.is_initialized:
+            return True
+        
         try:
             # Load pre-trained sentence transformer
-            self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+            self.model = self._load_model()
+            # An ONNX load that fell back to PyTorch changes the backend, and so the namespace
+            if self.cache.namespace != self._cache_namespace():
+                self.cache = EmbeddingCache(self._cache_namespace())
+            
             self.is_initialized = True
-            logger.info("NLP service initialized successfully with sentence-transformers")
+            logger.info(f"NLP service initialized successfully with sentence-transformers ({self.backend})")
             return True
             
         except Exception as e:
             logger.error(f"Error initializing NLP service: {e}")
             return False
     
+    def _load_model(self) -> SentenceTransformer:
+        """Load the model on the configured backend, compiling it when it runs on PyTorch"""
+        model, self.backend = load_sentence_model(self.backend)
+        if self.backend == 'torch':
+            self._compile_transformer(model)
+        return model
+    
+    def _compile_transformer(self, model: SentenceTransformer):
+        """Compile the underlying transformer in place, keeping eager mode if that fails
+        
+        Sequence length varies per batch, so the graph is compiled with dynamic
+        shapes rather than captured per shape.
+        """
+        try:
+            import torch
+            if not hasattr(torch, 'compile'):
+                return
+            
+            transformer = model[0]
+            eager_model = transformer.auto_model
+            transformer.auto_model = torch.compile(eager_model, dynamic=True)
+            try:
+                # Pay the compile cost at startup rather than on the first request
+                model.encode(["warm up"], show_progress_bar=False)
+            except Exception as e:
+                transformer.auto_model = eager_model
+                logger.warning(f"torch.compile failed for the text model, using eager mode: {e}")
+            
+        except Exception as e:
+            logger.warning(f"Could not compile the text model: {e}")
+    
+    def encode_batch(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Encode many texts in batched forward passes, returning unit-norm rows
+        
+        Inputs are sorted by length before batching (so each batch pads to a
+        similar length) and returned in input order.
+        """
+        if self.backend == 'torch':
+            return self._encode_direct(texts, batch_size)
+        
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        # float32 and C-contiguous so rows feed BLAS/FAISS without a hidden copy
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def _encode_direct(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Tokenize and run the transformer directly with mean pooling, bypassing SentenceTransformer.encode
+        
+        Matches the all-MiniLM-L6-v2 pipeline (Transformer -> mean Pooling ->
+        Normalize) without encode()'s per-call feature/device bookkeeping.
+        """
+        tokenizer = self.model.tokenizer
+        transformer = self.model[0].auto_model
+        device = self.model.device
+        
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        embeddings = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        
+        with torch.inference_mode():
+            for start in range(0, len(texts), batch_size):
+                batch_idx = order[start:start + batch_size]
+                features = tokenizer(
+                    [texts[i] for i in batch_idx],
+                    padding=True,
+                    truncation=True,
+                    max_length=self.model.max_seq_length,
+                    return_tensors='pt'
+                ).to(device)
+                
+                token_embeddings = transformer(**features).last_hidden_state
+                mask = features['attention_mask'].unsqueeze(-1).to(token_embeddings.dtype)
+                pooled = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                embeddings[batch_idx] = F.normalize(pooled, p=2, dim=1).float().cpu().numpy()
+        
+        return embeddings
+    
     def get_text_embedding(self, text: str) -> np.ndarray:
         """Get text embedding using sentence transformers"""
         if not self.is_initialized:
             logger.error("NLP service not initialized")
-            return np.random.rand(384)  # all-MiniLM-L6-v2 dimension
+            return ZERO_EMBEDDING
         
         try:
-            embedding = self.model.encode([text])[0]
+            key = self.cache.key(text)
+            embedding = self.cache.get(key)
+            if embedding is None:
+                embedding = self.encode_batch([text])[0]
+                self.cache.set(key, embedding)
             return embedding
             
         except Exception as e:
             logger.error(f"Error getting text embedding: {e}")
-            return np.random.rand(384)
+            return ZERO_EMBEDDING
+    
+    def get_text_embeddings(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Get embeddings for many texts in one batched encode call"""
+        if not self.is_initialized:
+            logger.error("NLP service not initialized")
+            return np.zeros((len(texts), len(ZERO_EMBEDDING)), dtype=np.float32)
+        
+        try:
+            # Only encode texts that are not already cached
+            hits = self.cache.get_many(texts)
+            misses = [i for i in range(len(texts)) if i not in hits]
+            
+            embeddings = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+            for i, vector in hits.items():
+                embeddings[i] = vector
+            
+            if misses:
+                # Encode each distinct text once and scatter it to every position that uses it
+                positions: Dict[str, List[int]] = {}
+                unique_texts = {}
+                for i in misses:
+                    key = self.cache.key(texts[i])
+                    positions.setdefault(key, []).append(i)
+                    unique_texts.setdefault(key, texts[i])
+                
+                encoded = self.encode_batch(list(unique_texts.values()), batch_size=batch_size)
+                for key, vector in zip(unique_texts, encoded):
+                    embeddings[positions[key]] = vector
+                    self.cache.set(key, vector)
+            
+            return embeddings
+            
+        except Exception as e:
+            logger.error(f"Error getting text embeddings: {e}")
+            return np.zeros((len(texts), len(ZERO_EMBEDDING)), dtype=np.float32)
     
     def get_product_embedding(self, product_data: Dict[str, Any]) -> np.ndarray:
         """Get combined embedding for product data"""
         try:
-            # Combine product features into text
-            text_parts = []
-            
-            if product_data.get('title'):
-                text_parts.append(str(product_data['title']))
-            if product_data.get('description'):
-                text_parts.append(str(product_data['description']))
-            if product_data.get('brand'):
-                text_parts.append(f"Brand: {product_data['brand']}")
-            if product_data.get('material'):
-                text_parts.append(f"Material: {product_data['material']}")
-            if product_data.get('categories'):
-                text_parts.append(f"Categories: {product_data['categories']}")
-            
-            combined_text = " ".join(text_parts)
-            return self.get_text_embedding(combined_text)
+            return self.get_text_embedding(product_text(product_data))
             
         except Exception as e:
             logger.error(f"Error generating product embedding: {e}")
-            return np.random.rand(384)
+            return ZERO_EMBEDDING
+    
+    def get_product_embeddings(self, products: List[Dict[str, Any]]) -> np.ndarray:
+        """Get combined embeddings for many products in one batched encode call"""
+        return self.get_text_embeddings([product_text(product) for product in products])
+    
+    @staticmethod
+    def normalize_embeddings(embeddings) -> np.ndarray:
+        """Stack embeddings into a contiguous (N, D) float32 matrix of unit-norm rows"""
+        matrix = np.array(embeddings, dtype=np.float32, order='C', ndmin=2)
+        # Row norms via einsum: no squared temporary matrix, no per-call norm dispatch
+        norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))[:, None]
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        return matrix
+    
+    @staticmethod
+    def quantize_embeddings(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Quantize unit-norm rows to int8 with a per-row scale, returning (int8 matrix, scales)"""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        max_abs = np.max(np.abs(matrix), axis=1, keepdims=True)
+        max_abs[max_abs == 0] = 1.0
+        scales = (127.0 / max_abs).astype(np.float32)
+        quantized = np.ascontiguousarray(np.round(matrix * scales), dtype=np.int8)
+        return quantized, scales.ravel()
     
-    def find_similar_products(self, query_text: str, product_embeddings: List[np.ndarray], 
-                            top_k: int = 10) -> List[Dict[str, Any]]:
-        """Find similar products based on text similarity"""
+    def _score(self, product_embeddings: np.ndarray, query_embedding: np.ndarray,
+               scales: Optional[np.ndarray]) -> np.ndarray:
+        """Dot the query against the corpus, upcasting int8/float16 corpora block by block"""
+        if product_embeddings.dtype == np.float32:
+            return product_embeddings @ query_embedding
+        
+        similarities = np.empty(len(product_embeddings), dtype=np.float32)
+        for start in range(0, len(product_embeddings), QUANTIZED_SCAN_BLOCK):
+            block = product_embeddings[start:start + QUANTIZED_SCAN_BLOCK]
+            similarities[start:start + len(block)] = block.astype(np.float32) @ query_embedding
+        if scales is not None:
+            similarities /= scales
+        return similarities
+    
+    def find_similar_products(self, query_text: str, product_embeddings: np.ndarray, 
+                            top_k: int = 10, scales: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Find similar products based on text similarity
+        
+        product_embeddings is an (N, D) matrix of unit-norm rows, as returned by
+        get_text_embeddings or normalize_embeddings, so cosine similarity is a
+        single matrix-vector product. Pass the int8 matrix and scales from
+        quantize_embeddings to search a corpus stored at a quarter of the size,
+        or a float16 matrix.
+        """
         if not self.is_initialized:
             return []
         
         try:
             # Get query embedding
-            query_embedding = self.get_text_embedding(query_text)
+            query_embedding = self.get_text_embedding(query_text).astype(np.float32)
+            query_embedding /= math.sqrt(float(np.vdot(query_embedding, query_embedding))) or 1.0
             
             # Calculate similarities
-            similarities = cosine_similarity([query_embedding], product_embeddings)[0]
+            similarities = self._score(product_embeddings, query_embedding, scales)
             
-            # Get top similar products
-            top_indices = np.argsort(similarities)[::-1][:top_k]
+            # Get top similar products (partial selection, then sort only the top k)
+            top_k = min(top_k, len(similarities))
+            if top_k <= 0:
+                return []
+            top_indices = np.argpartition(-similarities, top_k - 1)[:top_k]
+            top_indices = top_indices[np.argsort(-similarities[top_indices])]
             
             results = []
             for idx in top_indices:
@@ -104,15 +316,20 @@ class NLPService:
                              n_clusters: int = 10) -> Dict[str, Any]:
         """Group products into similar clusters"""
         try:
-            if len(product_embeddings) < n_clusters:
-                n_clusters = max(2, len(product_embeddings) // 2)
+            embeddings = np.ascontiguousarray(np.asarray(product_embeddings), dtype=np.float32)
             
-            # Perform K-means clustering
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-            cluster_labels = kmeans.fit_predict(product_embeddings)
+            if len(embeddings) < n_clusters:
+                n_clusters = max(2, len(embeddings) // 2)
             
-            # Calculate silhouette score
-            silhouette_avg = silhouette_score(product_embeddings, cluster_labels)
+            # Perform mini-batch K-means clustering
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42,
+                                     batch_size=CLUSTER_BATCH_SIZE, n_init=3, max_iter=100)
+            cluster_labels = kmeans.fit_predict(embeddings)
+            
+            # Calculate silhouette score on a subsample (the full score is O(N^2))
+            silhouette_avg = silhouette_score(embeddings, cluster_labels,
+                                              sample_size=min(SILHOUETTE_SAMPLE_SIZE, len(embeddings)),
+                                              random_state=42)
             
             # Group products by cluster
             clusters = {}
@@ -136,15 +353,10 @@ class NLPService:
         """Extract key terms from product text"""
         try:
             # Simple keyword extraction (in production, use more sophisticated methods)
-            words = text.lower().split()
-            
-            # Remove common stop words
-            stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
-            keywords = [word for word in words if word not in stop_words and len(word) > 2]
+            words = KEYWORD_PATTERN.findall(text.lower())
             
-            # Count frequency and return top keywords
-            from collections import Counter
-            keyword_counts = Counter(keywords)
+            # Count frequency of non-stop words and return top keywords
+            keyword_counts = Counter(word for word in words if word not in STOP_WORDS)
             return [word for word, count in keyword_counts.most_common(top_k)]
             
         except Exception as e:
@@ -156,7 +368,8 @@ class NLPService:
         return {
             "initialized": self.is_initialized,
             "model_available": self.model is not None,
-            "model_name": "sentence-transformers/all-MiniLM-L6-v2" if self.model else None
+            "model_name": MODEL_NAME if self.model else None,
+            "backend": self.backend
         }
 
 # Global instance
@@ -5,13 +5,75 @@ Handles vector database operations
 
 import os
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 import pinecone
-from sentence_transformers import SentenceTransformer
+from services.nlp_service import nlp_service
 
 logger = logging.getLogger(__name__)
 
+# Upserted components are rounded to this many decimals: finer than float16 for
+# unit-norm 384-d vectors, and well under half the JSON size of full float32 reprs
+WIRE_DECIMALS = 5
+
+# Opt-in: upsert each vector as its int8 codes, round(v * 127 / max|v|). Pinecone
+# stores float32 either way, but the cosine metric ignores the per-row scale, so no
+# scale is kept and queries stay float; upsert JSON shrinks to under half
+PINECONE_INT8 = os.getenv('PINECONE_INT8', '0').lower() in ('1', 'true', 'yes')
+
+# Async upserts allowed in flight before the oldest is awaited
+MAX_INFLIGHT_UPSERTS = 8
+
+def open_index(index_name: str):
+    """Connect to an index over gRPC when the grpc extra is installed, else over REST"""
+    grpc_index = getattr(pinecone, 'GRPCIndex', None)
+    if grpc_index is not None:
+        try:
+            return grpc_index(index_name)
+        except Exception as e:
+            logger.warning(f"Pinecone gRPC client unavailable, using REST: {e}")
+    # The REST client runs async_req calls on a thread pool of one by default
+    return pinecone.Index(index_name, pool_threads=MAX_INFLIGHT_UPSERTS)
+
+def wire_values(vectors: np.ndarray) -> List:
+    """Vectors as lists for transport; a (D,) array gives one list, (B, D) a list of lists
+    
+    Components are rounded floats, or int8 codes with PINECONE_INT8 set.
+    """
+    vectors = np.asarray(vectors)
+    if PINECONE_INT8:
+        quantized, _ = nlp_service.quantize_embeddings(vectors.reshape(-1, vectors.shape[-1]))
+        return quantized.reshape(vectors.shape).tolist()
+    return np.round(vectors.astype(np.float64), WIRE_DECIMALS).tolist()
+
+def resolve_async(request):
+    """Wait for a request made with async_req=True (gRPC futures and REST ApplyResults)"""
+    return request.result() if hasattr(request, 'result') else request.get()
+
+def settle_upserts(pending: List[Tuple[int, Any]], keep: int = 0) -> int:
+    """Await the oldest (count, request) upserts until at most ``keep`` remain; returns vectors upserted"""
+    upserted = 0
+    while len(pending) > keep:
+        count, request = pending.pop(0)
+        try:
+            resolve_async(request)
+            upserted += count
+            logger.info(f"Successfully upserted {count} vectors")
+        except Exception as e:
+            logger.error(f"Error upserting batch: {e}")
+    return upserted
+
+def format_matches(matches) -> List[Dict[str, Any]]:
+    """Flatten query matches into product dicts"""
+    return [
+        {
+            'id': match['id'],
+            'score': match['score'],
+            **match['metadata']
+        }
+        for match in matches
+    ]
+
 class PineconeService:
     """Service for Pinecone vector database operations"""
     
@@ -19,6 +81,7 @@ class PineconeService:
         self.pc = None
         self.index = None
         self.embedding_model = None
+        self.category_vectors: Dict[str, List[float]] = {}
         self.index_name = "ikarus-products"
         
     def initialize(self):
@@ -32,10 +95,12 @@ class PineconeService:
             pinecone.init(api_key=api_key, environment=os.getenv('PINECONE_ENVIRONMENT', 'us-east-1'))
             
             # Connect to index
-            self.index = pinecone.Index(self.index_name)
+            self.index = open_index(self.index_name)
             
-            # Load embedding model
-            self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+            # Share the NLP service's model (and its embedding cache) instead of loading a second copy
+            if not nlp_service.is_initialized and not nlp_service.initialize():
+                raise RuntimeError("NLP service failed to initialize")
+            self.embedding_model = nlp_service.model
             
             logger.info("Pinecone service initialized successfully")
             return True
@@ -44,6 +109,13 @@ class PineconeService:
             logger.error(f"Error initializing Pinecone service: {e}")
             return False
     
+    def _embed(self, text: str) -> np.ndarray:
+        """Embed text through the shared NLP service"""
+        embedding = nlp_service.get_text_embedding(text)
+        if not embedding.any():
+            raise ValueError("Failed to generate query embedding")
+        return embedding
+    
     def search_similar_products(self, query: str, top_k: int = 10, filters: Optional[Dict] = None) -> List[Dict[str, Any]]:
         """Search for similar products using vector similarity"""
         try:
@@ -51,7 +123,7 @@ class PineconeService:
                 raise ValueError("Pinecone index not initialized")
             
             # Generate query embedding
-            query_embedding = self.embedding_model.encode([query])[0]
+            query_embedding = self._embed(query)
             
             # Prepare search parameters
             search_params = {
@@ -68,14 +140,7 @@ class PineconeService:
             results = self.index.query(**search_params)
             
             # Format results
-            products = []
-            for match in results['matches']:
-                product = {
-                    'id': match['id'],
-                    'score': match['score'],
-                    **match['metadata']
-                }
-                products.append(product)
+            products = format_matches(results['matches'])
             
             logger.info(f"Found {len(products)} similar products for query: {query}")
             return products
@@ -112,12 +177,7 @@ class PineconeService:
             if not self.index:
                 raise ValueError("Pinecone index not initialized")
             
-            # First get the product vector
-            product_data = self.get_product_by_id(product_id)
-            if not product_data:
-                return []
-            
-            # Fetch the vector for similarity search
+            # Fetch the product vector (values and metadata come back in one response)
             results = self.index.fetch(ids=[product_id])
             if product_id not in results['vectors']:
                 return []
@@ -132,15 +192,9 @@ class PineconeService:
             )
             
             # Filter out the original product
-            similar_products = []
-            for match in search_results['matches']:
-                if match['id'] != product_id:
-                    product = {
-                        'id': match['id'],
-                        'score': match['score'],
-                        **match['metadata']
-                    }
-                    similar_products.append(product)
+            similar_products = format_matches(
+                match for match in search_results['matches'] if match['id'] != product_id
+            )
             
             logger.info(f"Found {len(similar_products)} similar products for product {product_id}")
             return similar_products
@@ -155,29 +209,24 @@ class PineconeService:
             if not self.index:
                 raise ValueError("Pinecone index not initialized")
             
-            # Create filter for category
+            # Exact match on the lowercased category names stored at ingest time
+            key = category.strip().lower()
             filters = {
-                "categories": {"$regex": category}
+                "category_tokens": {"$in": [key]}
             }
             
-            # Use a dummy vector for filtering (we're filtering, not searching by similarity)
-            dummy_vector = [0.0] * 384  # 384 is the dimension of our embeddings
+            # Rank the category's products by similarity to the category name itself
+            if key not in self.category_vectors:
+                self.category_vectors[key] = self._embed(category).tolist()
             
             results = self.index.query(
-                vector=dummy_vector,
+                vector=self.category_vectors[key],
                 top_k=top_k,
                 filter=filters,
                 include_metadata=True
             )
             
-            products = []
-            for match in results['matches']:
-                product = {
-                    'id': match['id'],
-                    'score': match['score'],
-                    **match['metadata']
-                }
-                products.append(product)
+            products = format_matches(results['matches'])
             
             logger.info(f"Found {len(products)} products in category: {category}")
             return products
@@ -3,112 +3,368 @@ Recommendation Service for Ikarus 3D
 Core recommendation logic using ML models and Pinecone
 """
 
+import math
+import json
+import asyncio
+import hashlib
 import logging
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import numpy as np
-from typing import List, Dict, Any, Optional
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Any, Optional, Tuple
 import pandas as pd
 import os
+import httpx
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pinecone
-from services.nlp_service import nlp_service
+from services.nlp_service import nlp_service, MODEL_NAME
 from services.langchain_service import langchain_service
+from services.similarity_cache import SimilarityCache
+from services.analytics_service import CSV_ENGINE, TEXT_FIELDS, category_tokens
+
+# Optional: SIMD cosine kernels (pip install simsimd); NumPy/BLAS is used without it
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+# Optional: HNSW graph search for large catalogs (pip install faiss-cpu)
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Optional: JIT-compiled scoring kernel for hosts with a slow BLAS (pip install numba)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 logger = logging.getLogger(__name__)
 
+# Product embeddings persisted between runs, keyed by the CSV contents and text model
+EMBEDDINGS_DIR = Path(__file__).parent.parent.parent / "data" / "processed" / "recommendation_embeddings"
+
+# With the int8 corpus, this many candidates per requested result are re-ranked in float32
+INT8_RERANK_FACTOR = 4
+
+# With the float16 scan copy, the shortlist is this many times top_k before the
+# float32 re-rank (float16 rounding only reorders near-ties)
+F16_RERANK_FACTOR = 2
+
+# Below this many products the exact float32 scan is cheap, so the int8/float16
+# shortlists (exact scores, approximate recall) are only used above it
+SHORTLIST_MIN_PRODUCTS = 20000
+
+# Below this many products a brute-force scan is fast enough; above it an HNSW index is built
+ANN_MIN_PRODUCTS = 50000
+
+# HNSW graph degree and search breadth; higher ef_search trades latency for recall
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+# Pinecone REST queries share one pooled, keep-alive session
+PINECONE_POOL_SIZE = 32
+PINECONE_TIMEOUT = 5  # seconds per read
+PINECONE_CONNECT_TIMEOUT = 2  # seconds
+PINECONE_CONCURRENCY = 16  # in-flight queries per batch
+PINECONE_BATCH_TIMEOUT = 10  # seconds for a whole batch; late queries are answered locally
+
+# Sync queries retry connection failures and gateway errors with a short backoff
+# before falling back to local search. /query only reads, so POST is safe to retry
+PINECONE_RETRY = Retry(total=2, connect=2, read=1, backoff_factor=0.2,
+                       status_forcelist=[502, 503, 504], allowed_methods=frozenset(["POST"]),
+                       raise_on_status=False)
+
+# Batched async queries multiplex over one HTTP/2 connection when h2 is installed
+# (pip install httpx[http2]); otherwise they use the pooled HTTP/1.1 connections
+PINECONE_HTTP2 = importlib.util.find_spec('h2') is not None
+
+# The brute-force scan streams the corpus in tiles of about this many bytes so each
+# tile stays cache-resident while it is scored and partitioned
+SCAN_TILE_BYTES = 2_000_000
+
+# Tiles are scored on a shared pool; NumPy releases the GIL inside the matmul. Each
+# matmul may itself use OMP_NUM_THREADS BLAS threads (main.py caps it at 2), so by
+# default the pool is sized to keep scan threads x BLAS threads at the core count
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS') or
+                   max(1, (os.cpu_count() or 1) // max(1, int(os.getenv('OMP_NUM_THREADS') or 1))))
+SCAN_POOL = ThreadPoolExecutor(max_workers=max(1, SCAN_WORKERS), thread_name_prefix="scan")
+
+# Per-thread score buffers, reused by every tile a thread scores
+_scan_scratch = threading.local()
+
+def scan_buffer(*shape: int, name: str = 'scores') -> np.ndarray:
+    """A float32 scratch buffer of ``shape`` owned by the calling thread"""
+    size = math.prod(shape)
+    buffer = getattr(_scan_scratch, name, None)
+    if buffer is None or len(buffer) < size:
+        buffer = np.empty(size, dtype=np.float32)
+        setattr(_scan_scratch, name, buffer)
+    return buffer[:size].reshape(shape)
+
+# Opt-in, since a good BLAS usually beats the JIT kernel
+USE_NUMBA = njit is not None and os.getenv('USE_NUMBA', '0').lower() in ('1', 'true', 'yes')
+
+if njit is not None:
+    @njit(fastmath=True, nogil=True, cache=True)
+    def cosine_matrix(query, products):
+        """Dot products of a unit-norm query with each unit-norm row"""
+        out = np.empty(products.shape[0], dtype=np.float32)
+        for i in range(products.shape[0]):
+            acc = np.float32(0.0)
+            for j in range(products.shape[1]):
+                acc += products[i, j] * query[j]
+            out[i] = acc
+        return out
+else:
+    cosine_matrix = None
+
+def cosine_scores(query: np.ndarray, embeddings_norm: np.ndarray,
+                  out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Cosine similarity of a unit-norm query against unit-norm rows
+    
+    ``out`` is an optional float32 buffer for the BLAS path to write into.
+    """
+    if USE_NUMBA:
+        return cosine_matrix(query.astype(np.float32, copy=False), np.asarray(embeddings_norm))
+    if simsimd is not None:
+        distances = simsimd.cdist(query.reshape(1, -1), embeddings_norm, metric='cosine')
+        return 1.0 - np.asarray(distances, dtype=np.float32).ravel()
+    return np.matmul(embeddings_norm, query, out=out)
+
 class RecommendationService:
     """Service for generating product recommendations using Pinecone and ML models"""
     
     def __init__(self):
         self.products_data = None
+        self.csv_path = None
+        self.category_index: Dict[str, np.ndarray] = {}
+        self.id_to_idx: Dict[str, int] = {}
+        self.product_embeddings = None
+        self.product_embeddings_norm = None
+        self.product_embeddings_i8 = None
+        self.product_embeddings_f16 = None
+        self.ann_index = None
         self.pc = None
         self.index = None
+        self._http = None
+        self._async_http = None
+        # Pinecone results reused for near-duplicate queries (created with the first Pinecone query)
+        self.similarity_cache: Optional[SimilarityCache] = None
         self.is_initialized = False
         
     def load_products_data(self, csv_path: str = "../data/raw/intern_data_ikarus.csv"):
         """Load products data from CSV"""
         try:
             logger.info(f"Loading products data from {csv_path}")
-            self.products_data = pd.read_csv(csv_path)
+            # Every column is kept: content and category recommendations return whole rows
+            self.products_data = pd.read_csv(csv_path, engine=CSV_ENGINE)
+            self.csv_path = csv_path
+            self._build_id_index()
+            self._build_category_index()
             logger.info(f"Loaded {len(self.products_data)} products")
             return True
         except Exception as e:
             logger.error(f"Error loading products data: {e}")
             return False
     
-    def prepare_text_features(self):
-        """Prepare text features for TF-IDF"""
+    def _build_id_index(self):
+        """Map each product id to its row, keeping the first row for duplicate ids"""
+        self.id_to_idx = {}
+        if 'uniq_id' in self.products_data:
+            for i, product_id in enumerate(self.products_data['uniq_id'].astype(str).values):
+                self.id_to_idx.setdefault(product_id, i)
+    
+    def _build_category_index(self):
+        """Map each lowercased category name to the sorted row indices that carry it"""
+        rows: Dict[str, List[int]] = {}
+        categories = self.products_data['categories'] if 'categories' in self.products_data else []
+        for i, value in enumerate(categories):
+            if pd.isna(value):
+                continue
+            for token in category_tokens(str(value)):
+                rows.setdefault(token, []).append(i)
+        self.category_index = {token: np.array(idx, dtype=np.int64) for token, idx in rows.items()}
+    
+    def _category_rows(self, category: str) -> np.ndarray:
+        """Sorted row indices of products with a category name containing the query"""
+        key = category.lower()
+        # Substring match over the distinct names rather than every row's string
+        matches = [idx for token, idx in self.category_index.items() if key in token]
+        if not matches:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(matches))
+    
+    def _product_texts(self) -> List[str]:
+        """Combine each product's non-null text fields, built column-wise rather than per row"""
+        columns = []
+        for field, prefix in TEXT_FIELDS:
+            column = self.products_data.get(field)
+            if column is None:
+                continue
+            columns.append((prefix + column.astype(str)).where(column.notna(), ''))
+        
+        if not columns:
+            return [''] * len(self.products_data)
+        return [" ".join(part for part in parts if part) for parts in zip(*columns)]
+    
+    def generate_embeddings(self):
+        """Generate embeddings for all products"""
         if self.products_data is None:
             logger.error("Products data not loaded")
             return False
         
         try:
-            # Combine text features
-            text_features = []
-            for _, row in self.products_data.iterrows():
-                features = []
-                if pd.notna(row.get('title')):
-                    features.append(str(row['title']))
-                if pd.notna(row.get('description')):
-                    features.append(str(row['description']))
-                if pd.notna(row.get('brand')):
-                    features.append(f"Brand: {row['brand']}")
-                if pd.notna(row.get('material')):
-                    features.append(f"Material: {row['material']}")
-                
-                combined_text = " ".join(features)
-                text_features.append(combined_text)
-            
-            # Create TF-IDF matrix
-            self.tfidf_vectorizer = TfidfVectorizer(
-                max_features=1000,
-                stop_words='english',
-                ngram_range=(1, 2)
-            )
-            self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(text_features)
-            
-            logger.info("Text features prepared successfully")
+            logger.info("Generating embeddings for all products...")
+            # One batched encode over the whole catalog (failed rows come back as zeros)
+            embeddings = nlp_service.get_text_embeddings(self._product_texts())
+            
+            self.product_embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            # Unit-norm rows so the fallback search is a single matrix-vector product
+            self.product_embeddings_norm = nlp_service.normalize_embeddings(self.product_embeddings)
+            # int8 copy for SimSIMD's integer cosine kernel (a quarter of the bytes per scan)
+            self.product_embeddings_i8 = (np.round(self.product_embeddings_norm * 127).astype(np.int8)
+                                          if simsimd is not None else None)
+            # float16 copy streamed by the brute-force scan (half the bytes of float32)
+            self.product_embeddings_f16 = self.product_embeddings_norm.astype(np.float16)
+            logger.info(f"Generated embeddings for {len(embeddings)} products")
+            self._save_embeddings()
+            self._build_ann_index()
             return True
         except Exception as e:
-            logger.error(f"Error preparing text features: {e}")
+            logger.error(f"Error generating embeddings: {e}")
             return False
     
-    def generate_embeddings(self):
-        """Generate embeddings for all products"""
-        if self.products_data is None:
-            logger.error("Products data not loaded")
-            return False
+    def _embeddings_key(self) -> str:
+        """Hash of the products CSV, text model and text fields the embeddings were built with"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.csv_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(f"{MODEL_NAME}:{nlp_service.backend}".encode('utf-8'))
+        # The text layout too, so a change to the embedded fields regenerates them
+        digest.update(json.dumps(TEXT_FIELDS).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _save_embeddings(self):
+        """Persist the embedding matrices so the next start can memory-map them"""
+        if self.csv_path is None:
+            return
         
         try:
-            logger.info("Generating embeddings for all products...")
-            embeddings = []
-            
-            for _, row in self.products_data.iterrows():
-                # Prepare text for embedding
-                text_parts = []
-                if pd.notna(row.get('title')):
-                    text_parts.append(str(row['title']))
-                if pd.notna(row.get('description')):
-                    text_parts.append(str(row['description']))
-                if pd.notna(row.get('brand')):
-                    text_parts.append(f"Brand: {row['brand']}")
-                if pd.notna(row.get('material')):
-                    text_parts.append(f"Material: {row['material']}")
-                
-                combined_text = " ".join(text_parts)
-                embedding = nlp_service.get_text_embedding(combined_text)
-                if embedding is not None:
-                    embeddings.append(embedding)
+            EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
+            meta_path = EMBEDDINGS_DIR / "meta.json"
+            # Removed first, so files from an interrupted save are never read as current
+            meta_path.unlink(missing_ok=True)
+            np.save(EMBEDDINGS_DIR / "embeddings.npy", self.product_embeddings)
+            np.save(EMBEDDINGS_DIR / "embeddings_norm.npy", self.product_embeddings_norm)
+            # Scan copies not built this time (no SimSIMD) are deleted rather than left stale
+            side_files = {}
+            for name, matrix in self._side_files():
+                if matrix is None:
+                    (EMBEDDINGS_DIR / name).unlink(missing_ok=True)
                 else:
-                    # Use zero vector as fallback
-                    embeddings.append(np.zeros(384))
+                    np.save(EMBEDDINGS_DIR / name, matrix)
+                    side_files[name] = list(matrix.shape)
+            # Written last, so a partial save never looks valid
+            meta_path.write_text(json.dumps({
+                "key": self._embeddings_key(),
+                "shape": list(self.product_embeddings.shape),
+                "side_files": side_files
+            }))
+            logger.info(f"Saved product embeddings to {EMBEDDINGS_DIR}")
+        except Exception as e:
+            logger.warning(f"Could not persist product embeddings: {e}")
+    
+    def _side_files(self) -> List[Tuple[str, Optional[np.ndarray]]]:
+        """The optional scan copies, as (file name, matrix or None)"""
+        return [("embeddings_i8.npy", self.product_embeddings_i8),
+                ("embeddings_f16.npy", self.product_embeddings_f16)]
+    
+    def _load_cached_embeddings(self) -> bool:
+        """Memory-map persisted embeddings if they match the loaded CSV and model"""
+        meta_path = EMBEDDINGS_DIR / "meta.json"
+        if self.csv_path is None or not meta_path.exists():
+            return False
+        
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta.get("key") != self._embeddings_key():
+                logger.info("Persisted product embeddings are stale; they will be regenerated")
+                return False
             
-            self.product_embeddings = np.array(embeddings)
-            logger.info(f"Generated embeddings for {len(embeddings)} products")
+            embeddings = np.load(EMBEDDINGS_DIR / "embeddings.npy", mmap_mode='r')
+            embeddings_norm = np.load(EMBEDDINGS_DIR / "embeddings_norm.npy", mmap_mode='r')
+            shape = list(embeddings.shape)
+            # Older saves may hold float64; the scan kernels expect contiguous float32
+            if (shape != meta.get("shape") or shape[0] != len(self.products_data)
+                    or list(embeddings_norm.shape) != shape
+                    or any(m.dtype != np.float32 or not m.flags.c_contiguous
+                           for m in (embeddings, embeddings_norm))):
+                logger.info("Persisted product embeddings don't match the catalog; they will be regenerated")
+                return False
+            
+            # Scan copies are used only if this save wrote them, with the same shape
+            side_files = meta.get("side_files", {})
+            side = {}
+            for name, _ in self._side_files():
+                path = EMBEDDINGS_DIR / name
+                if side_files.get(name) == shape and path.exists():
+                    matrix = np.load(path, mmap_mode='r')
+                    side[name] = matrix if list(matrix.shape) == shape else None
+            
+            self.product_embeddings = embeddings
+            self.product_embeddings_norm = embeddings_norm
+            self.product_embeddings_i8 = side.get("embeddings_i8.npy") if simsimd is not None else None
+            self.product_embeddings_f16 = side.get("embeddings_f16.npy")
+            logger.info(f"Loaded {len(self.product_embeddings)} persisted product embeddings")
+            self._build_ann_index()
             return True
         except Exception as e:
-            logger.error(f"Error generating embeddings: {e}")
+            logger.warning(f"Could not load persisted product embeddings: {e}")
             return False
     
+    def _get_similarity_cache(self) -> SimilarityCache:
+        """Similarity cache for Pinecone results, allocated only once Pinecone is in use"""
+        if self.similarity_cache is None:
+            self.similarity_cache = SimilarityCache()
+        return self.similarity_cache
+    
+    def _get_http(self) -> requests.Session:
+        """Shared Pinecone REST session, so queries reuse TCP and TLS connections"""
+        if self._http is None:
+            session = requests.Session()
+            session.headers.update({
+                "Api-Key": self.pinecone_api_key or '',
+                "Content-Type": "application/json"
+            })
+            session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=PINECONE_POOL_SIZE,
+                                                  max_retries=PINECONE_RETRY))
+            self._http = session
+        return self._http
+    
+    def _build_ann_index(self):
+        """Build an inner-product HNSW index once the catalog outgrows a brute-force scan"""
+        self.ann_index = None
+        if faiss is None or len(self.product_embeddings_norm) < ANN_MIN_PRODUCTS:
+            return
+        
+        try:
+            index = faiss.IndexHNSWFlat(self.product_embeddings_norm.shape[1], HNSW_M,
+                                        faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+            index.add(np.ascontiguousarray(self.product_embeddings_norm, dtype=np.float32))
+            self.ann_index = index
+            logger.info(f"Built HNSW index over {index.ntotal} products")
+        except Exception as e:
+            logger.warning(f"Could not build HNSW index, using brute-force search: {e}")
+    
     def get_similar_products(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
         """Get similar products based on query using Pinecone REST API"""
         if not self.is_initialized:
@@ -122,48 +378,33 @@ class RecommendationService:
                 
                 # Generate query embedding
                 query_embedding = nlp_service.get_text_embedding(query)
-                if query_embedding is None:
+                if query_embedding is None or not query_embedding.any():
                     logger.error("Failed to generate query embedding")
                     return []
                 
-                # Search Pinecone using REST API
-                import requests
-                headers = {
-                    "Api-Key": self.pinecone_api_key,
-                    "Content-Type": "application/json"
-                }
+                query_norm = nlp_service.normalize_embeddings(query_embedding)[0]
+                cached = self._get_similarity_cache().get(query_norm, top_k)
+                if cached is not None:
+                    logger.info(f"Served {len(cached)} similar products from the similarity cache")
+                    return cached
                 
-                query_payload = {
-                    "vector": query_embedding.tolist(),
-                    "topK": top_k,
-                    "includeMetadata": True
-                }
-                
-                response = requests.post(
-                    f"{self.pinecone_host}/query",
-                    headers=headers,
-                    json=query_payload
-                )
+                # Search Pinecone using REST API
+                try:
+                    response = self._get_http().post(
+                        f"{self.pinecone_host}/query",
+                        data=self._query_body(query_embedding, top_k),
+                        timeout=(PINECONE_CONNECT_TIMEOUT, PINECONE_TIMEOUT)
+                    )
+                except requests.RequestException as e:
+                    logger.error(f"Pinecone query failed: {e}")
+                    return self._get_similar_products_fallback(query, top_k)
                 
                 if response.status_code == 200:
-                    search_results = response.json()
-                    matches = search_results.get('matches', [])
+                    matches = orjson.loads(response.content).get('matches', [])
                     
                     # Format results
-                    results = []
-                    for match in matches:
-                        product = {
-                            'id': match['id'],
-                            'title': match['metadata'].get('title', ''),
-                            'brand': match['metadata'].get('brand', ''),
-                            'price': match['metadata'].get('price', ''),
-                            'description': match['metadata'].get('description', ''),
-                            'material': match['metadata'].get('material', ''),
-                            'categories': match['metadata'].get('categories', ''),
-                            'image': match['metadata'].get('image', ''),
-                            'similarity_score': float(match['score'])
-                        }
-                        results.append(product)
+                    results = [self._format_match(match) for match in matches]
+                    self._get_similarity_cache().set(query_norm, top_k, results)
                     
                     logger.info(f"Found {len(results)} similar products using Pinecone REST API")
                     return results
@@ -191,49 +432,26 @@ class RecommendationService:
             
             # Generate query embedding
             query_embedding = nlp_service.get_text_embedding(query)
-            if query_embedding is None:
+            if query_embedding is None or not query_embedding.any():
                 logger.error("Failed to generate query embedding")
                 return []
             
             # Generate embeddings for all products if not already done
-            if not hasattr(self, 'product_embeddings') or self.product_embeddings is None:
+            if self.product_embeddings_norm is None:
                 logger.info("Generating product embeddings...")
                 self.generate_embeddings()
             
-            if self.product_embeddings is None:
+            if self.product_embeddings_norm is None:
                 logger.error("Failed to generate product embeddings")
                 return []
             
-            # Calculate similarities
-            similarities = []
-            for idx, row in self.products_data.iterrows():
-                if idx < len(self.product_embeddings):
-                    product_embedding = self.product_embeddings[idx]
-                    similarity = np.dot(query_embedding, product_embedding) / (
-                        np.linalg.norm(query_embedding) * np.linalg.norm(product_embedding)
-                    )
-                    similarities.append((idx, similarity))
-            
-            # Sort by similarity and get top_k
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            top_indices = [idx for idx, _ in similarities[:top_k]]
+            # Calculate cosine similarities and get top_k
+            query_norm = np.asarray(query_embedding, dtype=np.float32)
+            query_norm = query_norm / math.sqrt(float(np.vdot(query_norm, query_norm)))
+            top_matches = self._top_similar(query_norm, top_k)
             
             # Format results
-            results = []
-            for idx in top_indices:
-                row = self.products_data.iloc[idx]
-                product = {
-                    'id': str(row.get('uniq_id', f'product_{idx}')),
-                    'title': str(row.get('title', '')),
-                    'brand': str(row.get('brand', '')),
-                    'price': str(row.get('price', '')),
-                    'description': str(row.get('description', '')),
-                    'material': str(row.get('material', '')),
-                    'categories': str(row.get('categories', '')),
-                    'image': str(row.get('images', '')),
-                    'similarity_score': float(similarities[top_indices.index(idx)][1])
-                }
-                results.append(product)
+            results = self._format_rows(top_matches)
             
             logger.info(f"Found {len(results)} similar products using fallback vector similarity")
             return results
@@ -242,40 +460,282 @@ class RecommendationService:
             logger.error(f"Error in fallback similarity search: {e}")
             return []
     
+    def _format_match(self, match: Dict[str, Any]) -> Dict[str, Any]:
+        """Product dict for a Pinecone REST match"""
+        metadata = match.get('metadata', {})
+        return {
+            'id': match['id'],
+            'title': metadata.get('title', ''),
+            'brand': metadata.get('brand', ''),
+            'price': metadata.get('price', ''),
+            'description': metadata.get('description', ''),
+            'material': metadata.get('material', ''),
+            'categories': metadata.get('categories', ''),
+            'image': metadata.get('image', ''),
+            'similarity_score': float(match['score'])
+        }
+    
+    def _format_rows(self, matches: List[Tuple[int, float]]) -> List[Dict[str, Any]]:
+        """Product dicts for (row index, score) matches, gathered with one iloc"""
+        rows = self.products_data.iloc[[idx for idx, _ in matches]].to_dict('records')
+        return [
+            {
+                'id': str(row.get('uniq_id', f'product_{idx}')),
+                'title': str(row.get('title', '')),
+                'brand': str(row.get('brand', '')),
+                'price': str(row.get('price', '')),
+                'description': str(row.get('description', '')),
+                'material': str(row.get('material', '')),
+                'categories': str(row.get('categories', '')),
+                'image': str(row.get('images', '')),
+                'similarity_score': score
+            }
+            for row, (idx, score) in zip(rows, matches)
+        ]
+    
+    def _top_similar(self, query_norm: np.ndarray, top_k: int,
+                     exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (index, cosine) pairs for a unit-norm query, best first
+        
+        Small catalogs get an exact float32 scan. Above SHORTLIST_MIN_PRODUCTS,
+        candidates are shortlisted on the int8 (with SimSIMD) or float16 copy
+        and re-ranked in float32: scores stay exact, but a product outside
+        the shortlist is never considered. Above ANN_MIN_PRODUCTS the HNSW
+        index is searched when Faiss is available, also approximate recall.
+        """
+        query_norm = np.asarray(query_norm, dtype=np.float32)
+        n = len(self.product_embeddings_norm)
+        top_k = min(top_k, n - (exclude is not None))
+        if top_k <= 0:
+            return []
+        
+        if self.ann_index is not None:
+            # One extra neighbour covers the excluded product
+            scores, ids = self.ann_index.search(query_norm.reshape(1, -1), top_k + (exclude is not None))
+            matches = [(int(i), float(v)) for i, v in zip(ids[0], scores[0]) if i >= 0 and i != exclude]
+            return matches[:top_k]
+        
+        shortlist = self._uses_shortlist()
+        if shortlist and self.product_embeddings_i8 is not None:
+            query_i8 = np.round(query_norm * 127).astype(np.int8)
+            distances = simsimd.cdist(query_i8.reshape(1, -1), self.product_embeddings_i8, metric='cosine')
+            coarse = np.nan_to_num(1.0 - np.asarray(distances, dtype=np.float32).ravel(), nan=-1.0)
+            if exclude is not None:
+                coarse[exclude] = -np.inf
+            k = min(top_k * INT8_RERANK_FACTOR, n)
+            candidates = np.argpartition(-coarse, k - 1)[:k]
+            scores = self.product_embeddings_norm[candidates] @ query_norm
+        elif shortlist:
+            k = min(top_k * F16_RERANK_FACTOR, n - (exclude is not None))
+            candidates, _ = self._scan_top_k(query_norm, k, exclude, embeddings=self.product_embeddings_f16)
+            scores = self.product_embeddings_norm[candidates] @ query_norm
+        else:
+            candidates, scores = self._scan_top_k(query_norm, top_k, exclude)
+        
+        # Partial selection, then sort only the top_k
+        if exclude is not None:
+            scores[candidates == exclude] = -np.inf
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+    
+    def _uses_shortlist(self) -> bool:
+        """Whether the catalog is large enough to rank through an int8/float16 shortlist"""
+        if self.product_embeddings_i8 is None and self.product_embeddings_f16 is None:
+            return False
+        return len(self.product_embeddings_norm) >= SHORTLIST_MIN_PRODUCTS
+    
+    def _scan_top_k(self, query_norm: np.ndarray, top_k: int, exclude: Optional[int] = None,
+                    embeddings: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k candidates over the corpus, scanned tile by tile
+        
+        Tiles come from the float32 matrix and are exact, unless another copy
+        (the float16 one) is passed in; its tiles are upcast into a per-thread
+        float32 buffer and the scores are approximate.
+        """
+        if embeddings is None:
+            embeddings = self.product_embeddings_norm
+        # Sized on float32 rows so an upcast tile is what stays cache-resident
+        tile = max(1, SCAN_TILE_BYTES // (embeddings.shape[1] * np.dtype(np.float32).itemsize))
+        
+        def scan_tile(start: int) -> Tuple[np.ndarray, np.ndarray]:
+            rows = embeddings[start:start + tile]
+            if rows.dtype != np.float32:
+                upcast = scan_buffer(*rows.shape, name='rows')
+                upcast[...] = rows
+                rows = upcast
+            scores = cosine_scores(query_norm, rows, out=scan_buffer(len(rows)))
+            if exclude is not None and start <= exclude < start + len(scores):
+                scores[exclude - start] = -np.inf
+            # Only the selected scores leave the thread's scratch buffer
+            if len(scores) <= top_k:
+                return np.arange(start, start + len(scores)), scores.copy()
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            return keep + start, scores[keep]
+        
+        starts = range(0, len(embeddings), tile)
+        partials = [scan_tile(0)] if len(starts) == 1 else list(SCAN_POOL.map(scan_tile, starts))
+        
+        # Merge the per-tile top-k buffers
+        idx = np.concatenate([p[0] for p in partials])
+        scores = np.concatenate([p[1] for p in partials])
+        if len(scores) > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            idx, scores = idx[keep], scores[keep]
+        return idx, scores
+    
+    def _top_similar_batch(self, queries_norm: np.ndarray, top_k: int) -> List[List[Tuple[int, float]]]:
+        """Top-k (index, cosine) pairs for each unit-norm query row, via one (B, N) matmul
+        
+        When single queries go through the ANN index or a shortlist, each row is
+        ranked the same way instead, so both endpoints return the same results.
+        """
+        n = len(self.product_embeddings_norm)
+        top_k = min(top_k, n)
+        if top_k <= 0:
+            return [[] for _ in range(len(queries_norm))]
+        
+        if self.ann_index is not None or self._uses_shortlist():
+            return [self._top_similar(query, top_k) for query in queries_norm]
+        
+        scores = np.asarray(queries_norm, dtype=np.float32) @ self.product_embeddings_norm.T
+        best = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        return [[(int(i), float(v)) for i, v in zip(row_idx, row_scores)]
+                for row_idx, row_scores in zip(best, best_scores)]
+    
+    @staticmethod
+    def _query_body(embedding: np.ndarray, top_k: int) -> bytes:
+        """Serialize a Pinecone query, encoding the vector straight from the float32 array"""
+        vector = np.ascontiguousarray(embedding, dtype=np.float32)
+        return orjson.dumps({"vector": vector, "topK": top_k, "includeMetadata": True},
+                            option=orjson.OPT_SERIALIZE_NUMPY)
+    
+    def _get_async_http(self) -> httpx.AsyncClient:
+        """Create the pooled async Pinecone client on first use (inside the running loop)"""
+        if self._async_http is None:
+            self._async_http = httpx.AsyncClient(
+                base_url=self.pinecone_host,
+                headers={"Api-Key": self.pinecone_api_key or '', "Content-Type": "application/json"},
+                limits=httpx.Limits(max_connections=PINECONE_POOL_SIZE,
+                                    max_keepalive_connections=PINECONE_POOL_SIZE),
+                timeout=httpx.Timeout(PINECONE_TIMEOUT, connect=PINECONE_CONNECT_TIMEOUT),
+                http2=PINECONE_HTTP2
+            )
+        return self._async_http
+    
+    async def _query_pinecone(self, embedding: np.ndarray, top_k: int,
+                              semaphore: asyncio.Semaphore) -> Optional[List[Dict[str, Any]]]:
+        """One Pinecone REST query; None on failure so the caller can fall back"""
+        try:
+            async with semaphore:
+                response = await self._get_async_http().post("/query", content=self._query_body(embedding, top_k))
+            response.raise_for_status()
+            return [self._format_match(match) for match in orjson.loads(response.content).get('matches', [])]
+        except Exception as e:
+            logger.error(f"Pinecone query failed: {e}")
+            return None
+    
+    async def get_similar_products_batch(self, queries: List[str], top_k: int = 10) -> List[List[Dict[str, Any]]]:
+        """Similar products for many queries, with Pinecone requests overlapped
+        
+        Without Pinecone (or for the queries it fails), all queries are answered
+        locally with a single matrix product against the catalog. Encoding and
+        the local search run in the default executor, off the event loop.
+        """
+        if not self.is_initialized:
+            logger.error("Recommendation service not initialized")
+            return [[] for _ in queries]
+        
+        try:
+            loop = asyncio.get_running_loop()
+            embeddings = np.asarray(
+                await loop.run_in_executor(None, nlp_service.get_text_embeddings, queries), dtype=np.float32
+            )
+            results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+            valid = [i for i in range(len(queries)) if embeddings[i].any()]
+            
+            if getattr(self, 'pinecone_host', None) and valid:
+                # Near-duplicates of recently answered queries don't go to Pinecone
+                queries_norm = nlp_service.normalize_embeddings(embeddings)
+                similarity_cache = self._get_similarity_cache()
+                for i in valid:
+                    results[i] = similarity_cache.get(queries_norm[i], top_k)
+                
+                semaphore = asyncio.Semaphore(PINECONE_CONCURRENCY)
+                tasks = {i: asyncio.create_task(self._query_pinecone(embeddings[i], top_k, semaphore))
+                         for i in valid if results[i] is None}
+                # Every query may have been a cache hit, and asyncio.wait rejects an empty set
+                late = set()
+                if tasks:
+                    _, late = await asyncio.wait(tasks.values(), timeout=PINECONE_BATCH_TIMEOUT)
+                if late:
+                    # Queries still waiting when the budget runs out go to the local search below
+                    logger.warning(f"{len(late)} Pinecone queries exceeded the batch timeout")
+                    for task in late:
+                        task.cancel()
+                    await asyncio.gather(*late, return_exceptions=True)
+                for i, task in tasks.items():
+                    if not task.cancelled():
+                        results[i] = task.result()
+                        if results[i] is not None:
+                            similarity_cache.set(queries_norm[i], top_k, results[i])
+            
+            pending = [i for i in valid if results[i] is None]
+            if pending:
+                if self.product_embeddings_norm is None:
+                    await loop.run_in_executor(None, self.generate_embeddings)
+                if self.product_embeddings_norm is not None:
+                    local = await loop.run_in_executor(None, self._search_locally, embeddings[pending], top_k)
+                    for i, products in zip(pending, local):
+                        results[i] = products
+            
+            logger.info(f"Answered {len(queries)} similar-product queries in one batch")
+            return [r if r is not None else [] for r in results]
+            
+        except Exception as e:
+            logger.error(f"Error getting batched similar products: {e}")
+            return [[] for _ in queries]
+    
+    def _search_locally(self, embeddings: np.ndarray, top_k: int) -> List[List[Dict[str, Any]]]:
+        """Formatted local results for each query embedding row, via one batched matmul"""
+        queries_norm = nlp_service.normalize_embeddings(embeddings)
+        return [self._format_rows(matches) for matches in self._top_similar_batch(queries_norm, top_k)]
+    
+    async def aclose(self):
+        """Close the async Pinecone client (call on application shutdown)"""
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+    
     def get_content_based_recommendations(self, product_id: str, top_k: int = 10) -> List[Dict[str, Any]]:
         """Get content-based recommendations for a specific product"""
-        if self.product_embeddings is None:
+        if self.product_embeddings_norm is None:
             logger.error("Product embeddings not generated")
             return []
         
         try:
             # Find the product index
-            product_idx = None
-            for idx, row in self.products_data.iterrows():
-                if str(row.get('uniq_id', '')) == product_id:
-                    product_idx = idx
-                    break
+            product_idx = self.id_to_idx.get(product_id)
             
             if product_idx is None:
                 logger.warning(f"Product {product_id} not found")
                 return []
             
             # Get product embedding
-            product_embedding = self.product_embeddings[product_idx].reshape(1, -1)
-            
-            # Calculate similarities
-            similarities = cosine_similarity(product_embedding, self.product_embeddings)[0]
+            product_embedding = self.product_embeddings_norm[product_idx]
             
-            # Remove the product itself and get top similar
-            similarities[product_idx] = -1  # Exclude the product itself
-            top_indices = np.argsort(similarities)[::-1][:top_k]
+            # Calculate similarities, excluding the product itself
+            top_matches = self._top_similar(product_embedding, top_k, exclude=product_idx)
             
             results = []
-            for idx in top_indices:
-                if idx != product_idx:  # Double check
-                    product = self.products_data.iloc[idx].to_dict()
-                    product['similarity_score'] = float(similarities[idx])
-                    results.append(product)
+            for idx, score in top_matches:
+                product = self.products_data.iloc[idx].to_dict()
+                product['similarity_score'] = score
+                results.append(product)
             
             logger.info(f"Found {len(results)} content-based recommendations for product {product_id}")
             return results
@@ -291,17 +751,15 @@ class RecommendationService:
             return []
         
         try:
-            # Filter products by category
-            category_products = self.products_data[
-                self.products_data['categories'].str.contains(category, case=False, na=False)
-            ]
+            # Look up products by category
+            rows = self._category_rows(category)
             
-            if len(category_products) == 0:
+            if len(rows) == 0:
                 logger.warning(f"No products found for category: {category}")
                 return []
             
             # Return top products in category (could be sorted by price, rating, etc.)
-            results = category_products.head(top_k).to_dict('records')
+            results = self.products_data.iloc[rows[:top_k]].to_dict('records')
             
             logger.info(f"Found {len(results)} products in category: {category}")
             return results
@@ -310,6 +768,15 @@ class RecommendationService:
             logger.error(f"Error getting category recommendations: {e}")
             return []
     
+    def _warm_up(self):
+        """Run one local search so the first request doesn't pay for lazy setup
+        
+        Builds the product embeddings if none were persisted, faults in the
+        memory-mapped matrices and compiles the optional Numba kernel.
+        """
+        logger.info("Warming up local similarity search...")
+        self._get_similar_products_fallback("warm up", top_k=1)
+    
     def initialize_service(self):
         """Initialize the recommendation service with Pinecone and ML models"""
         try:
@@ -335,9 +802,15 @@ class RecommendationService:
             logger.warning("Skipping Pinecone initialization due to network issues - using fallback search")
             self.pinecone_host = None
             self.pinecone_api_key = None
-            
-            # Load products data for fallback
-            self.load_products_data()
+            # Results cached before a re-initialization may come from an older index
+            if self.similarity_cache is not None:
+                self.similarity_cache.clear()
+            
+            # Load products data for fallback, reusing persisted embeddings when current
+            if self.load_products_data():
+                self._load_cached_embeddings()
+                # Before reporting ready, so /ready stays 503 until queries are fast
+                self._warm_up()
             
             self.is_initialized = True
             logger.info("Recommendation service initialized successfully")
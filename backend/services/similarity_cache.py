@@ -0,0 +1,82 @@
+"""
+Similarity Cache for Ikarus 3D
+Serves Pinecone results for queries whose embedding is close to a recently answered one
+"""
+
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Recent queries kept, and how close (cosine) a new query must be to reuse one's results
+SIMILARITY_CACHE_SIZE = int(os.getenv('SIMILARITY_CACHE_SIZE', '10000'))
+SIMILARITY_CACHE_THRESHOLD = float(os.getenv('SIMILARITY_CACHE_THRESHOLD', '0.95'))
+# Seconds a result is served for, so a repopulated index is picked up without a restart
+SIMILARITY_CACHE_TTL = float(os.getenv('SIMILARITY_CACHE_TTL', '300'))
+
+class SimilarityCache:
+    """LRU of (query embedding -> results), looked up by nearest cached embedding
+
+    The cached embeddings sit in one preallocated matrix and are scanned exactly:
+    at this size a matrix-vector product takes well under a millisecond, and an
+    evicted slot is simply overwritten.
+    """
+
+    def __init__(self, dim: int = 384, capacity: int = SIMILARITY_CACHE_SIZE,
+                 threshold: float = SIMILARITY_CACHE_THRESHOLD, ttl: float = SIMILARITY_CACHE_TTL):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        # slot -> (top_k the results were fetched with, results, monotonic time stored),
+        # least recently used first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query_norm: np.ndarray, top_k: int) -> Optional[List[Dict[str, Any]]]:
+        """Results of the closest cached query, if within the threshold, unexpired and fetched with >= top_k"""
+        if not self._entries:
+            return None
+        query_norm = np.asarray(query_norm, dtype=np.float32)
+        # Score outside the lock so concurrent lookups don't serialize on the matvec;
+        # unused slots are zero vectors, so they never clear the threshold
+        scores = self._matrix @ query_norm
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.threshold:
+            return None
+        with self._lock:
+            entry = self._entries.get(slot)
+            # The slot may have been overwritten since it was scored, so re-check it
+            if entry is None or entry[0] < top_k or float(self._matrix[slot] @ query_norm) < self.threshold:
+                return None
+            if time.monotonic() - entry[2] > self.ttl:
+                # Zeroed so it no longer shadows fresher entries, and evicted next
+                self._matrix[slot] = 0.0
+                self._entries.move_to_end(slot, last=False)
+                return None
+            self._entries.move_to_end(slot)
+            return [dict(result) for result in entry[1][:top_k]]
+    
+    def set(self, query_norm: np.ndarray, top_k: int, results: List[Dict[str, Any]]):
+        """Remember the results fetched for a unit-norm query embedding"""
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if len(self._entries) < self.capacity:
+                slot = len(self._entries)
+            else:
+                slot, _ = self._entries.popitem(last=False)
+            self._matrix[slot] = query_norm
+            # Copied, so a caller mutating its list afterwards can't change the cached entry
+            self._entries[slot] = (top_k, [dict(result) for result in results], time.monotonic())
+
+    def clear(self):
+        """Drop every cached result (e.g. after the index is repopulated)"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix[:] = 0.0
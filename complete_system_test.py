@@ -4,22 +4,84 @@ Complete End-to-End System Test
 Tests all features working together
 """
 
-import requests
+import asyncio
+import importlib.util
+import httpx
+import orjson
 import json
 import time
 
+# Every probe goes through one pooled keep-alive client (HTTP/2 when h2 is installed)
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=8)
+HTTP2 = importlib.util.find_spec('h2') is not None
+
 def test_complete_system():
     """Test complete end-to-end functionality"""
+    return asyncio.run(run_checks())
+
+async def fetch(client: httpx.AsyncClient, method: str, url: str, **kwargs):
+    """Send one probe, returning the response or the exception it raised"""
+    try:
+        return await client.request(method, url, **kwargs)
+    except Exception as e:
+        return e
+
+def unwrap(response):
+    """Re-raise a probe's exception so each check reports it as before"""
+    if isinstance(response, Exception):
+        raise response
+    return response
+
+async def run_checks():
+    """Run every check against the backend and frontend with one shared client
+    
+    Independent probes are sent concurrently, so the run takes as long as the
+    slowest request rather than their sum; results are still printed in order.
+    """
     print("COMPLETE END-TO-END SYSTEM TEST")
     print("=" * 60)
     
     base_url = "http://localhost:8000"
     frontend_url = "http://localhost:3000"
     
+    test_queries = [
+        "modern sofa",
+        "leather chair",
+        "wooden table",
+        "office furniture"
+    ]
+    
+    async with httpx.AsyncClient(http2=HTTP2, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS) as client:
+        health, frontend = await asyncio.gather(
+            fetch(client, "GET", f"{base_url}/health"),
+            fetch(client, "GET", frontend_url, timeout=5)
+        )
+        # The feature checks only run once both services are up
+        if isinstance(health, httpx.Response) and health.status_code == 200 and \
+                isinstance(frontend, httpx.Response) and frontend.status_code == 200:
+            single, recommendations, description, analytics, sample = await asyncio.gather(
+                # The single-query endpoint the frontend calls, alongside the batch probe
+                fetch(client, "POST", f"{base_url}/api/v1/recommendations/",
+                      json={"query": test_queries[0], "limit": 3}, timeout=10),
+                fetch(client, "POST", f"{base_url}/api/v1/recommendations/batch",
+                      json={"queries": test_queries, "limit": 3}, timeout=10),
+                fetch(client, "POST", f"{base_url}/api/v1/products/generate-description",
+                      json={
+                          "title": "Modern Leather Sofa",
+                          "brand": "TestBrand",
+                          "material": "Leather",
+                          "price": "$299.99"
+                      },
+                      timeout=15),
+                fetch(client, "GET", f"{base_url}/api/v1/analytics/overview", timeout=10),
+                fetch(client, "GET", f"{base_url}/api/v1/products/sample", timeout=10)
+            )
+    
     # Test 1: Backend Health
     print("\n1. Testing Backend Health...")
     try:
-        response = requests.get(f"{base_url}/health")
+        response = unwrap(health)
         if response.status_code == 200:
             print("SUCCESS: Backend is healthy")
         else:
@@ -32,7 +94,7 @@ def test_complete_system():
     # Test 2: Frontend Accessibility
     print("\n2. Testing Frontend Accessibility...")
     try:
-        response = requests.get(frontend_url, timeout=5)
+        response = unwrap(frontend)
         if response.status_code == 200:
             print("SUCCESS: Frontend is accessible")
         else:
@@ -44,48 +106,39 @@ def test_complete_system():
     
     # Test 3: Product Recommendations
     print("\n3. Testing Product Recommendations...")
-    test_queries = [
-        "modern sofa",
-        "leather chair",
-        "wooden table",
-        "office furniture"
-    ]
+    try:
+        response = unwrap(single)
+        if response.status_code == 200:
+            results = orjson.loads(response.content).get('recommendations', [])
+            print(f"SUCCESS: Single query '{test_queries[0]}': {len(results)} results")
+        else:
+            print(f"ERROR: Single query '{test_queries[0]}' failed: {response.status_code}")
+    except Exception as e:
+        print(f"ERROR: Single query '{test_queries[0]}' error: {e}")
     
-    for query in test_queries:
-        try:
-            response = requests.post(
-                f"{base_url}/api/v1/recommendations/",
-                json={"query": query, "top_k": 3},
-                timeout=10
-            )
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get('recommendations', [])
+    # One batched request: the queries are embedded together and searched concurrently
+    try:
+        response = unwrap(recommendations)
+        if response.status_code == 200:
+            for entry in orjson.loads(response.content).get('results', []):
+                query = entry.get('query')
+                results = entry.get('recommendations', [])
                 print(f"SUCCESS: Query '{query}': {len(results)} results")
                 if results:
                     top_result = results[0]
                     print(f"   Top result: {top_result.get('title', 'No title')[:50]}...")
                     print(f"   Similarity: {top_result.get('similarity_score', 0):.3f}")
-            else:
-                print(f"ERROR: Query '{query}' failed: {response.status_code}")
-        except Exception as e:
-            print(f"ERROR: Query '{query}' error: {e}")
+        else:
+            print(f"ERROR: Batched queries failed: {response.status_code}")
+    except Exception as e:
+        print(f"ERROR: Batched queries error: {e}")
     
     # Test 4: AI Description Generation
     print("\n4. Testing AI Description Generation...")
     try:
-        response = requests.post(
-            f"{base_url}/api/v1/products/generate-description",
-            json={
-                "title": "Modern Leather Sofa",
-                "brand": "TestBrand",
-                "material": "Leather",
-                "price": "$299.99"
-            },
-            timeout=15
-        )
+        response = unwrap(description)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             description = data.get('description', '')
             print(f"SUCCESS: AI Description generated: {len(description)} characters")
             print(f"   Preview: {description[:100]}...")
@@ -97,9 +150,9 @@ def test_complete_system():
     # Test 5: Analytics Data
     print("\n5. Testing Analytics Data...")
     try:
-        response = requests.get(f"{base_url}/api/v1/analytics/overview", timeout=10)
+        response = unwrap(analytics)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             analytics = data.get('data', {})
             print(f"SUCCESS: Analytics working:")
             print(f"   Total products: {analytics.get('total_products', 0)}")
@@ -113,9 +166,9 @@ def test_complete_system():
     # Test 6: Sample Products
     print("\n6. Testing Sample Products...")
     try:
-        response = requests.get(f"{base_url}/api/v1/products/sample", timeout=10)
+        response = unwrap(sample)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             products = data.get('products', [])
             print(f"SUCCESS: Sample products: {len(products)} products")
             if products:
@@ -12,10 +12,14 @@ import numpy as np
 from pathlib import Path
 from dotenv import load_dotenv
 import pinecone
-from sentence_transformers import SentenceTransformer
 import time
 import json
 
+# Add backend to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+from services.analytics_service import CSV_ENGINE, TEXT_FIELDS, category_tokens
+
 # Load environment variables
 load_dotenv()
 
@@ -23,6 +27,9 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns read from the CSV: the text fields plus the id, price and image metadata
+PRODUCT_COLUMNS = ['uniq_id', 'title', 'description', 'brand', 'material', 'categories', 'price', 'images']
+
 class PineconePopulator:
     """Handles population of Pinecone index with product data and embeddings."""
     
@@ -47,9 +54,12 @@ class PineconePopulator:
             # Initialize Pinecone
             pinecone.init(api_key=api_key, environment=environment)
             
-            # Check if index exists, create if not
-            existing_indexes = pinecone.list_indexes()
-            index_exists = any(idx.name == self.index_name for idx in existing_indexes)
+            # Check if index exists, create if not (one lookup rather than listing every index)
+            try:
+                pinecone.describe_index(self.index_name)
+                index_exists = True
+            except pinecone.NotFoundException:
+                index_exists = False
             
             if not index_exists:
                 logger.info(f"Creating new Pinecone index '{self.index_name}'...")
@@ -75,6 +85,8 @@ class PineconePopulator:
         """Load the sentence transformer model."""
         try:
             logger.info("Loading SentenceTransformer model...")
+            # Imported here so a missing API key fails before the torch import
+            from sentence_transformers import SentenceTransformer
             self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
             logger.info("SentenceTransformer model loaded successfully.")
             return True
@@ -86,29 +98,21 @@ class PineconePopulator:
         """Load product data from CSV."""
         try:
             logger.info(f"Loading products data from {csv_path}")
-            df = pd.read_csv(csv_path)
+            df = pd.read_csv(csv_path, usecols=PRODUCT_COLUMNS, engine=CSV_ENGINE)
             logger.info(f"Loaded {len(df)} products.")
             return df
         except Exception as e:
             logger.error(f"Error loading products data: {e}")
             return None
     
-    def prepare_product_text(self, row):
-        """Prepare text for embedding from product row."""
-        text_parts = []
-        
-        if pd.notna(row.get('title')):
-            text_parts.append(str(row['title']))
-        if pd.notna(row.get('description')):
-            text_parts.append(str(row['description']))
-        if pd.notna(row.get('brand')):
-            text_parts.append(f"Brand: {row['brand']}")
-        if pd.notna(row.get('material')):
-            text_parts.append(f"Material: {row['material']}")
-        if pd.notna(row.get('categories')):
-            text_parts.append(f"Categories: {row['categories']}")
-        
-        return " ".join(text_parts)
+    def prepare_product_texts(self, df: pd.DataFrame):
+        """Prepare the embedding text of every product column-wise, skipping missing fields."""
+        columns = []
+        for field, prefix in TEXT_FIELDS:
+            if field in df:
+                values = df[field]
+                columns.append((prefix + values.map(str)).where(values.notna(), '').tolist())
+        return [" ".join(part for part in parts if part) for parts in zip(*columns)]
     
     def populate_pinecone(self, df: pd.DataFrame, batch_size: int = 50):
         """Generate embeddings and populate Pinecone with all products."""
@@ -117,49 +121,45 @@ class PineconePopulator:
             return False
         
         logger.info("Generating embeddings and uploading to Pinecone...")
-        vectors_to_upsert = []
         
-        for idx, row in df.iterrows():
-            try:
-                product_id = str(row.get('uniq_id', f'product_{idx}'))
-                
-                # Prepare text for embedding
-                combined_text = self.prepare_product_text(row)
-                
-                # Generate embedding
-                embedding = self.embedding_model.encode([combined_text])[0]
-                
-                # Prepare metadata
-                metadata = {
-                    'title': str(row.get('title', '')),
-                    'brand': str(row.get('brand', '')),
-                    'price': str(row.get('price', '')),
-                    'categories': str(row.get('categories', '')),
-                    'material': str(row.get('material', '')),
-                    'description': str(row.get('description', ''))[:1000],  # Limit description length
-                    'image': str(row.get('images', ''))[:500]  # Limit image URL length
+        # One encode call for the whole catalog; the model batches internally
+        texts = self.prepare_product_texts(df)
+        embeddings = self.embedding_model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+        
+        # Ids and metadata built from whole columns rather than per row
+        def column(name):
+            return df[name].map(str).tolist() if name in df else [''] * len(df)
+        
+        ids = column('uniq_id') if 'uniq_id' in df else [f'product_{idx}' for idx in df.index]
+        vectors = [
+            {
+                'id': product_id,
+                'values': values,
+                'metadata': {
+                    'title': title,
+                    'brand': brand,
+                    'price': price,
+                    'categories': categories,
+                    'category_tokens': category_tokens(categories),  # For category filters
+                    'material': material,
+                    'description': description[:1000],  # Limit description length
+                    'image': image[:500]  # Limit image URL length
                 }
-                
-                vectors_to_upsert.append({
-                    'id': product_id,
-                    'values': embedding.tolist(),
-                    'metadata': metadata
-                })
-                
-                # Upload in batches
-                if len(vectors_to_upsert) >= batch_size:
-                    self.index.upsert(vectors=vectors_to_upsert)
-                    logger.info(f"Uploaded batch {len(vectors_to_upsert)} vectors")
-                    vectors_to_upsert = []
-                    
-            except Exception as e:
-                logger.warning(f"Error processing product {idx}: {e}")
-                continue
+            }
+            for product_id, values, title, brand, price, categories, material, description, image in zip(
+                ids, embeddings.tolist(), column('title'), column('brand'), column('price'),
+                column('categories'), column('material'), column('description'), column('images')
+            )
+        ]
         
-        # Upload remaining vectors
-        if vectors_to_upsert:
-            self.index.upsert(vectors=vectors_to_upsert)
-            logger.info(f"Uploaded final batch of {len(vectors_to_upsert)} vectors")
+        # Upload in batches
+        for i in range(0, len(vectors), batch_size):
+            batch = vectors[i:i + batch_size]
+            try:
+                self.index.upsert(vectors=batch)
+                logger.info(f"Uploaded batch {len(batch)} vectors")
+            except Exception as e:
+                logger.warning(f"Error uploading batch starting at product {i}: {e}")
         
         logger.info(f"Successfully populated Pinecone with {len(df)} products.")
         return True
@@ -3,6 +3,8 @@ Ikarus 3D Data Analysis Script
 Comprehensive EDA for furniture product dataset
 """
 
+import sys
+import itertools
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -11,9 +13,20 @@ from pathlib import Path
 import logging
 from typing import Dict, List, Tuple, Any
 import json
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import re
 
+# Optional: Rust JSON serializer with native NumPy support; stdlib json is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from services.analytics_service import CSV_ENGINE, parse_list_literal
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,6 +34,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def parse_list(value: Any) -> Any:
+    """Parse a stringified list literal; None if it is not one"""
+    if not isinstance(value, str):
+        return value
+    return parse_list_literal(value)
+
 class IkarusDataAnalyzer:
     """Comprehensive data analysis for Ikarus 3D furniture dataset"""
     
@@ -29,29 +48,68 @@ class IkarusDataAnalyzer:
         self.data_path = Path(data_path)
         self.df = None
         self.analysis_results = {}
+        self._counts_cache = {}
         
     def load_data(self) -> pd.DataFrame:
         """Load and validate dataset"""
         try:
             logger.info(f"Loading data from {self.data_path}")
-            self.df = pd.read_csv(self.data_path)
+            # Every column is kept: basic_info reports on the full schema
+            self.df = pd.read_csv(self.data_path, engine=CSV_ENGINE)
+            self._counts_cache = {}
             logger.info(f"Dataset loaded: {self.df.shape[0]} rows, {self.df.shape[1]} columns")
             return self.df
         except Exception as e:
             logger.error(f"Error loading data: {e}")
             raise
     
-    def basic_info(self) -> Dict[str, Any]:
-        """Get basic dataset information"""
+    def _column_counts(self, column: str) -> Tuple[pd.Index, np.ndarray]:
+        """Distinct non-null values of a column and their counts, in first-appearance order"""
+        if column not in self._counts_cache:
+            codes, uniques = pd.factorize(self.df[column])
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self._counts_cache[column] = (uniques, counts)
+        return self._counts_cache[column]
+    
+    def _top_counts(self, column: str, k: int = 10) -> Dict[Any, int]:
+        """The k most frequent values of a column, ties in first-appearance order like value_counts()"""
+        return self._select_top(*self._column_counts(column), k)
+    
+    @staticmethod
+    def _select_top(uniques, counts: np.ndarray, k: int = 10) -> Dict[Any, int]:
+        """The k largest counts with their values, without sorting all of them"""
+        if len(counts) > k:
+            # k-th largest count via a partial partition; ties at it go to the earliest values
+            threshold = np.partition(counts, len(counts) - k)[len(counts) - k]
+            above = np.flatnonzero(counts > threshold)
+            ties = np.flatnonzero(counts == threshold)[:k - len(above)]
+            candidates = np.concatenate([above, ties])
+        else:
+            candidates = np.arange(len(counts))
+        # Stable order: by count descending, then first appearance
+        candidates = candidates[np.lexsort((candidates, -counts[candidates]))]
+        return {uniques[i]: int(counts[i]) for i in candidates}
+    
+    def basic_info(self, verbose: bool = False) -> Dict[str, Any]:
+        """Get basic dataset information
+        
+        Duplicates are counted by product id. ``verbose`` measures memory deeply,
+        walking every string; otherwise only the column buffers are counted.
+        """
         logger.info("Analyzing basic dataset information")
         
+        if 'uniq_id' in self.df:
+            duplicates = self.df['uniq_id'].duplicated().sum()
+        else:
+            duplicates = self.df.duplicated().sum()
+        
         info = {
             "shape": self.df.shape,
             "columns": list(self.df.columns),
-            "dtypes": self.df.dtypes.to_dict(),
-            "missing_values": self.df.isnull().sum().to_dict(),
-            "duplicates": self.df.duplicated().sum(),
-            "memory_usage": self.df.memory_usage(deep=True).sum()
+            "dtypes": {column: str(dtype) for column, dtype in self.df.dtypes.items()},
+            "missing_values": {column: int(count) for column, count in self.df.isnull().sum().items()},
+            "duplicates": int(duplicates),
+            "memory_usage": int(self.df.memory_usage(deep=verbose).sum())
         }
         
         self.analysis_results["basic_info"] = info
@@ -61,20 +119,20 @@ class IkarusDataAnalyzer:
         """Analyze price distribution and statistics"""
         logger.info("Analyzing price data")
         
-        # Clean price data
-        df_price = self.df.copy()
-        df_price['price_clean'] = df_price['price'].str.replace('$', '').astype(float)
+        # Clean price data (one column, no copy of the frame)
+        prices = pd.to_numeric(self.df['price'].str.lstrip('$'), errors='coerce')
+        desc = prices.describe(percentiles=[0.25, 0.5, 0.75, 0.99])
         
         price_stats = {
-            "count": df_price['price_clean'].count(),
-            "mean": df_price['price_clean'].mean(),
-            "median": df_price['price_clean'].median(),
-            "std": df_price['price_clean'].std(),
-            "min": df_price['price_clean'].min(),
-            "max": df_price['price_clean'].max(),
-            "q25": df_price['price_clean'].quantile(0.25),
-            "q75": df_price['price_clean'].quantile(0.75),
-            "outliers": len(df_price[df_price['price_clean'] > df_price['price_clean'].quantile(0.99)])
+            "count": int(desc['count']),
+            "mean": float(desc['mean']),
+            "median": float(desc['50%']),
+            "std": float(desc['std']),
+            "min": float(desc['min']),
+            "max": float(desc['max']),
+            "q25": float(desc['25%']),
+            "q75": float(desc['75%']),
+            "outliers": int((prices > desc['99%']).sum())
         }
         
         self.analysis_results["price_analysis"] = price_stats
@@ -85,22 +143,16 @@ class IkarusDataAnalyzer:
         logger.info("Analyzing category distribution")
         
         # Parse categories (they're stored as string representations of lists)
-        categories = []
-        for cat_str in self.df['categories'].dropna():
-            try:
-                # Clean and parse category string
-                cat_list = eval(cat_str) if isinstance(cat_str, str) else cat_str
-                categories.extend(cat_list)
-            except:
-                continue
-        
-        category_counts = Counter(categories)
+        parsed = self.df['categories'].dropna().map(parse_list).dropna()
+        items = np.array(list(itertools.chain.from_iterable(parsed)), dtype=object)
+        codes, categories = pd.factorize(items, use_na_sentinel=False)
+        counts = np.bincount(codes, minlength=len(categories))
         
         category_stats = {
-            "total_categories": len(category_counts),
-            "top_10_categories": dict(category_counts.most_common(10)),
-            "category_distribution": dict(category_counts),
-            "avg_categories_per_product": len(categories) / len(self.df)
+            "total_categories": len(categories),
+            "top_10_categories": self._select_top(categories, counts),
+            "category_distribution": dict(zip(categories, counts.tolist())),
+            "avg_categories_per_product": int(counts.sum()) / len(self.df)
         }
         
         self.analysis_results["category_analysis"] = category_stats
@@ -110,14 +162,15 @@ class IkarusDataAnalyzer:
         """Analyze brand distribution"""
         logger.info("Analyzing brand data")
         
-        brand_counts = self.df['brand'].value_counts()
+        _, brand_counts = self._column_counts('brand')
+        top_brands = self._top_counts('brand')
         
         brand_stats = {
             "total_brands": len(brand_counts),
-            "top_10_brands": brand_counts.head(10).to_dict(),
+            "top_10_brands": top_brands,
             "brand_diversity": len(brand_counts) / len(self.df),
-            "most_common_brand": brand_counts.index[0] if len(brand_counts) > 0 else None,
-            "brands_with_multiple_products": len(brand_counts[brand_counts > 1])
+            "most_common_brand": next(iter(top_brands), None),
+            "brands_with_multiple_products": int((brand_counts > 1).sum())
         }
         
         self.analysis_results["brand_analysis"] = brand_stats
@@ -127,13 +180,14 @@ class IkarusDataAnalyzer:
         """Analyze material composition"""
         logger.info("Analyzing material data")
         
-        material_counts = self.df['material'].value_counts()
+        _, material_counts = self._column_counts('material')
+        top_materials = self._top_counts('material')
         
         material_stats = {
             "total_materials": len(material_counts),
-            "top_materials": material_counts.head(10).to_dict(),
+            "top_materials": top_materials,
             "material_diversity": len(material_counts) / len(self.df),
-            "most_common_material": material_counts.index[0] if len(material_counts) > 0 else None
+            "most_common_material": next(iter(top_materials), None)
         }
         
         self.analysis_results["material_analysis"] = material_stats
@@ -143,43 +197,42 @@ class IkarusDataAnalyzer:
         """Analyze country of origin"""
         logger.info("Analyzing geographic distribution")
         
-        country_counts = self.df['country_of_origin'].value_counts()
+        _, country_counts = self._column_counts('country_of_origin')
+        top_countries = self._top_counts('country_of_origin')
         
         geo_stats = {
             "total_countries": len(country_counts),
-            "top_countries": country_counts.head(10).to_dict(),
+            "top_countries": top_countries,
             "geographic_diversity": len(country_counts) / len(self.df),
-            "most_common_country": country_counts.index[0] if len(country_counts) > 0 else None
+            "most_common_country": next(iter(top_countries), None)
         }
         
         self.analysis_results["geographic_analysis"] = geo_stats
         return geo_stats
     
+    def _length_stats(self, lengths: pd.Series) -> Dict[str, Any]:
+        """Length statistics from a describe() of string lengths"""
+        return {
+            "avg_length": float(lengths['mean']),
+            "min_length": float(lengths['min']),
+            "max_length": float(lengths['max']),
+            "std_length": float(lengths['std'])
+        }
+    
     def text_analysis(self) -> Dict[str, Any]:
         """Analyze text content (titles, descriptions)"""
         logger.info("Analyzing text content")
         
-        # Title analysis
-        title_lengths = self.df['title'].str.len()
-        
-        # Description analysis
-        desc_lengths = self.df['description'].str.len()
+        # One describe() per column; count doubles as the non-null tally
+        title_lengths = self.df['title'].str.len().describe()
+        desc_lengths = self.df['description'].str.len().describe()
+        with_descriptions = int(desc_lengths['count'])
         
         text_stats = {
-            "title_stats": {
-                "avg_length": title_lengths.mean(),
-                "min_length": title_lengths.min(),
-                "max_length": title_lengths.max(),
-                "std_length": title_lengths.std()
-            },
-            "description_stats": {
-                "avg_length": desc_lengths.mean(),
-                "min_length": desc_lengths.min(),
-                "max_length": desc_lengths.max(),
-                "std_length": desc_lengths.std()
-            },
-            "products_with_descriptions": desc_lengths.notna().sum(),
-            "products_without_descriptions": desc_lengths.isna().sum()
+            "title_stats": self._length_stats(title_lengths),
+            "description_stats": self._length_stats(desc_lengths),
+            "products_with_descriptions": with_descriptions,
+            "products_without_descriptions": len(self.df) - with_descriptions
         }
         
         self.analysis_results["text_analysis"] = text_stats
@@ -189,21 +242,18 @@ class IkarusDataAnalyzer:
         """Analyze image data"""
         logger.info("Analyzing image data")
         
-        # Parse image URLs
-        image_counts = []
-        for img_str in self.df['images'].dropna():
-            try:
-                img_list = eval(img_str) if isinstance(img_str, str) else img_str
-                image_counts.append(len(img_list))
-            except:
-                image_counts.append(0)
+        # Image counts per product (unparseable lists count as no images)
+        image_counts = self.df['images'].dropna().map(parse_list).map(
+            lambda images: len(images) if images is not None else 0
+        ).to_numpy(dtype=np.int32)
+        with_images = int(np.count_nonzero(image_counts))
         
         image_stats = {
-            "products_with_images": len([x for x in image_counts if x > 0]),
-            "products_without_images": len([x for x in image_counts if x == 0]),
-            "avg_images_per_product": np.mean(image_counts) if image_counts else 0,
-            "max_images_per_product": max(image_counts) if image_counts else 0,
-            "min_images_per_product": min(image_counts) if image_counts else 0
+            "products_with_images": with_images,
+            "products_without_images": len(image_counts) - with_images,
+            "avg_images_per_product": float(image_counts.mean()) if len(image_counts) else 0,
+            "max_images_per_product": int(image_counts.max()) if len(image_counts) else 0,
+            "min_images_per_product": int(image_counts.min()) if len(image_counts) else 0
         }
         
         self.analysis_results["image_analysis"] = image_stats
@@ -247,15 +297,24 @@ class IkarusDataAnalyzer:
         # Load data
         self.load_data()
         
-        # Run all analyses
-        self.basic_info()
-        self.price_analysis()
-        self.category_analysis()
-        self.brand_analysis()
-        self.material_analysis()
-        self.geographic_analysis()
-        self.text_analysis()
-        self.image_analysis()
+        # Run all analyses. They only read self.df, so they run concurrently on
+        # threads (most of the work is in pandas/NumPy kernels); results are then
+        # stored in a fixed order so the report layout doesn't depend on timing
+        analyses = {
+            "basic_info": self.basic_info,
+            "price_analysis": self.price_analysis,
+            "category_analysis": self.category_analysis,
+            "brand_analysis": self.brand_analysis,
+            "material_analysis": self.material_analysis,
+            "geographic_analysis": self.geographic_analysis,
+            "text_analysis": self.text_analysis,
+            "image_analysis": self.image_analysis
+        }
+        with ThreadPoolExecutor(max_workers=len(analyses)) as pool:
+            futures = {name: pool.submit(analysis) for name, analysis in analyses.items()}
+            for name, future in futures.items():
+                self.analysis_results.pop(name, None)
+                self.analysis_results[name] = future.result()
         
         # Generate insights
         insights = self.generate_insights()
@@ -269,8 +328,15 @@ class IkarusDataAnalyzer:
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_path, 'w') as f:
-            json.dump(self.analysis_results, f, indent=2, default=str)
+        if orjson is not None:
+            output_path.write_bytes(orjson.dumps(
+                self.analysis_results,
+                default=str,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            ))
+        else:
+            with open(output_path, 'w') as f:
+                json.dump(self.analysis_results, f, indent=2, default=str)
         
         logger.info(f"Analysis results saved to {output_path}")
 
@@ -6,12 +6,13 @@ Populates Pinecone vector database with product embeddings
 import os
 import sys
 import logging
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from dotenv import load_dotenv
 import pinecone
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Add backend to path
 sys.path.append(str(Path(__file__).parent.parent / "backend"))
@@ -19,6 +20,10 @@ sys.path.append(str(Path(__file__).parent.parent / "backend"))
 from services.nlp_service import nlp_service
 from services.cv_service import cv_service
 from services.langchain_service import langchain_service
+from services.pinecone_service import (
+    MAX_INFLIGHT_UPSERTS, open_index, settle_upserts, wire_values
+)
+from services.analytics_service import category_tokens, parse_list_literal
 
 # Load environment variables
 load_dotenv()
@@ -42,161 +47,281 @@ def initialize_services():
     
     return nlp_success and cv_success and langchain_success
 
-def load_products_data():
-    """Load products from CSV"""
-    try:
-        data_path = Path(__file__).parent.parent / "data" / "raw" / "intern_data_ikarus.csv"
-        df = pd.read_csv(data_path)
-        logger.info(f"Loaded {len(df)} products from dataset")
-        return df
-    except Exception as e:
-        logger.error(f"Error loading products data: {e}")
+DATA_PATH = Path(__file__).parent.parent / "data" / "raw" / "intern_data_ikarus.csv"
+
+def iter_product_batches(data_path=DATA_PATH, batch_size: int = 50):
+    """Stream the CSV a few batches at a time, yielding (products, image URLs, metadata) per batch
+    
+    Reading in chunks bounds memory by the chunk size and lets the first upsert
+    start before the whole file has been parsed. The pyarrow engine can't read
+    in chunks, so this uses pandas' C parser.
+    """
+    # Only the columns that feed the embeddings and metadata; a callable skips any that
+    # are missing instead of raising, so prepare_products can fill them in
+    wanted = {'uniq_id', *PRODUCT_COLUMNS.values()}
+    chunks = pd.read_csv(
+        data_path, usecols=lambda column: column in wanted, chunksize=batch_size * CHUNK_BATCHES
+    )
+    for chunk in chunks:
+        products, image_urls, metadata = prepare_products(chunk)
+        for i in range(0, len(chunk), batch_size):
+            yield products[i:i+batch_size], image_urls[i:i+batch_size], metadata[i:i+batch_size]
+
+# Product fields taken from the CSV, as {field: column}
+PRODUCT_COLUMNS = {
+    'title': 'title',
+    'brand': 'brand',
+    'material': 'material',
+    'categories': 'categories',
+    'price': 'price',
+    'description': 'description',
+    'image': 'images'
+}
+
+# Metadata fields stored with each vector, truncated to these lengths
+METADATA_LIMITS = {
+    'title': 1000,
+    'brand': 100,
+    'material': 100,
+    'categories': 500,
+    'price': 50,
+    'description': 1000,
+    'image': 500
+}
+
+# Batches parsed from the CSV per read
+CHUNK_BATCHES = 4
+
+# Image downloads in flight while the current batch is embedded
+DOWNLOAD_WORKERS = 32
+
+# Dimension of the Pinecone index (sentence-transformers embeddings)
+PINECONE_DIM = 384
+
+def first_image_url(images: str):
+    """First URL of a stringified image list, or None"""
+    if not images or images == 'nan':
         return None
+    image_urls = parse_list_literal(images)
+    if image_urls and isinstance(image_urls[0], str):
+        return image_urls[0].strip()
+    return None
+
+def prepare_products(df):
+    """Build every product dict, vector metadata and first image URL column-wise, in dataset order"""
+    columns = {
+        field: df[column].map(str) if column in df else pd.Series('', index=df.index)
+        for field, column in PRODUCT_COLUMNS.items()
+    }
+    if 'uniq_id' in df:
+        columns['id'] = df['uniq_id'].map(str)
+    else:
+        columns['id'] = pd.Series([f'product_{idx}' for idx in df.index], index=df.index)
+    
+    products = pd.DataFrame(columns)[['id', *PRODUCT_COLUMNS]].to_dict('records')
+    image_urls = columns['image'].map(first_image_url).tolist()
+    
+    # Truncate whole columns at once; category tokens come from the full category string
+    metadata_columns = {field: columns[field].str.slice(0, limit) for field, limit in METADATA_LIMITS.items()}
+    metadata_columns['category_tokens'] = columns['categories'].map(category_tokens)
+    metadata = pd.DataFrame(metadata_columns)[[
+        'title', 'brand', 'material', 'categories', 'category_tokens', 'price', 'description', 'image'
+    ]].to_dict('records')
+    return products, image_urls, metadata
+
+def create_combined_embeddings(nlp_batch: np.ndarray, cv_batch: np.ndarray):
+    """Combine text and image embeddings for a batch, returning (vectors, valid mask)
+    
+    Rows are a 0.7/0.3 weighted sum of the unit-norm text and image embeddings,
+    cut or padded to the index dimension. A zero image row (no usable image)
+    leaves the product text-only; a zero text row means encoding failed, and
+    that product is marked invalid.
+    """
+    nlp_batch = np.asarray(nlp_batch, dtype=np.float32)
+    cv_batch = np.asarray(cv_batch, dtype=np.float32)
+    
+    def unit_rows(matrix):
+        norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+        return matrix / np.where(norms == 0, 1.0, norms)[:, None], norms > 0
+    
+    nlp_norm, valid = unit_rows(nlp_batch)
+    cv_norm, has_image = unit_rows(cv_batch)
+    
+    # Match the image features to the text dimension once for the whole batch
+    dim = nlp_norm.shape[1]
+    cv_norm = cv_norm[:, :dim]
+    if cv_norm.shape[1] < dim:
+        cv_norm = np.pad(cv_norm, ((0, 0), (0, dim - cv_norm.shape[1])))
+    
+    combined = np.where(has_image[:, None], 0.7 * nlp_norm + 0.3 * cv_norm, nlp_norm)
+    
+    # Ensure it's the right dimension for Pinecone (384 for sentence-transformers)
+    if dim > PINECONE_DIM:
+        combined = combined[:, :PINECONE_DIM]
+    elif dim < PINECONE_DIM:
+        combined = np.pad(combined, ((0, 0), (0, PINECONE_DIM - dim)))
+    
+    return np.ascontiguousarray(combined, dtype=np.float32), valid
 
-def create_combined_embedding(product_data, nlp_embedding, cv_embedding):
-    """Create combined embedding from text and image features"""
+def connect_index():
+    """Initialize Pinecone and connect to the products index, or None on failure"""
+    api_key = os.getenv('PINECONE_API_KEY')
+    if not api_key:
+        logger.error("PINECONE_API_KEY not found")
+        return None
+    
+    index_name = os.getenv('PINECONE_INDEX_NAME', 'ikarus-products')
+    
     try:
-        # Normalize embeddings
-        nlp_norm = nlp_embedding / np.linalg.norm(nlp_embedding)
-        cv_norm = cv_embedding / np.linalg.norm(cv_embedding)
-        
-        # Combine embeddings (weighted average)
-        combined = 0.7 * nlp_norm + 0.3 * cv_norm
-        
-        # Ensure it's the right dimension for Pinecone (384 for sentence-transformers)
-        if len(combined) > 384:
-            combined = combined[:384]
-        elif len(combined) < 384:
-            # Pad with zeros if needed
-            combined = np.pad(combined, (0, 384 - len(combined)), 'constant')
-        
-        return combined.tolist()
-        
+        pinecone.init(api_key=api_key, environment=os.getenv('PINECONE_ENVIRONMENT', 'us-east-1'))
+        index = open_index(index_name)
+        logger.info(f"Connected to Pinecone index: {index_name}")
+        return index
     except Exception as e:
-        logger.error(f"Error creating combined embedding: {e}")
-        return np.random.rand(384).tolist()
+        logger.error(f"Error connecting to Pinecone index: {e}")
+        return None
 
-def populate_pinecone():
-    """Main function to populate Pinecone"""
+def populate_from_file(index, data_path=DATA_PATH):
+    """Embed and upsert the products in one CSV, with services already initialized"""
     try:
-        # Initialize services
-        if not initialize_services():
-            logger.error("Failed to initialize services")
-            return False
-        
-        # Load products data
-        df = load_products_data()
-        if df is None:
-            return False
-        
-        # Initialize Pinecone
-        api_key = os.getenv('PINECONE_API_KEY')
-        if not api_key:
-            logger.error("PINECONE_API_KEY not found")
-            return False
-        
-        pinecone.init(api_key=api_key, environment=os.getenv('PINECONE_ENVIRONMENT', 'us-east-1'))
-        index_name = os.getenv('PINECONE_INDEX_NAME', 'ikarus-products')
-        
-        # Connect to index
-        try:
-            index = pinecone.Index(index_name)
-            logger.info(f"Connected to Pinecone index: {index_name}")
-        except Exception as e:
-            logger.error(f"Error connecting to Pinecone index: {e}")
-            return False
-        
-        # Process products in batches
+        # Process products in batches, reading the CSV as it is consumed
         batch_size = 50
-        total_products = len(df)
+        batches = iter_product_batches(data_path, batch_size)
         
-        logger.info(f"Starting to process {total_products} products...")
+        logger.info(f"Starting to process products from {data_path}...")
         
-        for i in range(0, total_products, batch_size):
-            batch_df = df.iloc[i:i+batch_size]
-            vectors_to_upsert = []
+        # Upserts are sent asynchronously so the next batch is embedded while
+        # earlier ones are in flight, with at most MAX_INFLIGHT_UPSERTS outstanding
+        pending_upserts = []
+        total_products = 0
+        
+        # Images for the next batch download while the current one runs through the models
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_pool:
+            def prefetch_images(batch):
+                if batch is None:
+                    return []
+                _, image_urls, _ = batch
+                return [
+                    download_pool.submit(cv_service.load_image_from_url, url) if url else None
+                    for url in image_urls
+                ]
             
-            logger.info(f"Processing batch {i//batch_size + 1}/{(total_products-1)//batch_size + 1}")
+            batch = next(batches, None)
+            next_downloads = prefetch_images(batch)
+            batch_number = 0
             
-            for idx, row in batch_df.iterrows():
-                try:
-                    # Prepare product data
-                    product_data = {
-                        'id': str(row.get('uniq_id', f'product_{idx}')),
-                        'title': str(row.get('title', '')),
-                        'brand': str(row.get('brand', '')),
-                        'material': str(row.get('material', '')),
-                        'categories': str(row.get('categories', '')),
-                        'price': str(row.get('price', '')),
-                        'description': str(row.get('description', '')),
-                        'image': str(row.get('images', ''))
-                    }
-                    
-                    # Generate embeddings
-                    nlp_embedding = nlp_service.get_product_embedding(product_data)
-                    
-                    # Get image embedding (use first image URL if available)
-                    cv_embedding = np.random.rand(2048)  # Default for now
-                    if product_data['image'] and product_data['image'] != 'nan':
-                        try:
-                            # Parse image URLs (they're stored as string representation of list)
-                            import ast
-                            image_urls = ast.literal_eval(product_data['image'])
-                            if image_urls and len(image_urls) > 0:
-                                cv_embedding = cv_service.get_image_embedding(image_urls[0])
-                        except:
-                            pass
-                    
-                    # Create combined embedding
-                    combined_embedding = create_combined_embedding(
-                        product_data, nlp_embedding, cv_embedding
-                    )
-                    
-                    # Prepare metadata
-                    metadata = {
-                        'title': product_data['title'][:1000],  # Limit length
-                        'brand': product_data['brand'][:100],
-                        'material': product_data['material'][:100],
-                        'categories': product_data['categories'][:500],
-                        'price': product_data['price'][:50],
-                        'description': product_data['description'][:1000],
-                        'image': product_data['image'][:500]
-                    }
+            while batch is not None:
+                vectors_to_upsert = []
+                batch_number += 1
+                
+                logger.info(f"Processing batch {batch_number}")
+                
+                products, _, metadata = batch
+                batch_products = list(zip(products, metadata))
+                total_products += len(batch_products)
+                
+                # Start the next batch's downloads, then embed this batch's images in one forward pass;
+                # zero rows mark products without a usable image, which stay text-only
+                downloads = next_downloads
+                batch = next(batches, None)
+                next_downloads = prefetch_images(batch)
+                images = [download.result() if download is not None else None for download in downloads]
+                cv_batch = cv_service.embed_images(images)
+                
+                # Text embeddings for the whole batch in one encode call
+                nlp_batch = nlp_service.get_product_embeddings(
+                    [product_data for product_data, _ in batch_products]
+                )
+                
+                # Combine the whole batch at once, converting to rounded lists once at the boundary
+                combined_batch, valid = create_combined_embeddings(nlp_batch, cv_batch)
+                combined_lists = wire_values(combined_batch)
+                
+                for (product_data, product_metadata), combined_embedding, is_valid in zip(
+                    batch_products, combined_lists, valid
+                ):
+                    if not is_valid:
+                        # Don't upsert a junk vector; skip the product instead
+                        logger.warning(f"No text embedding for product {product_data['id']}")
+                        continue
                     
                     # Add to batch
                     vectors_to_upsert.append({
                         'id': product_data['id'],
                         'values': combined_embedding,
-                        'metadata': metadata
+                        'metadata': product_metadata
                     })
-                    
-                except Exception as e:
-                    logger.error(f"Error processing product {idx}: {e}")
-                    continue
-            
-            # Upsert batch to Pinecone
-            if vectors_to_upsert:
-                try:
-                    index.upsert(vectors=vectors_to_upsert)
-                    logger.info(f"Successfully upserted {len(vectors_to_upsert)} vectors")
-                except Exception as e:
-                    logger.error(f"Error upserting batch: {e}")
-            
-            # Small delay to avoid rate limiting
-            time.sleep(0.1)
+                
+                # Upsert batch to Pinecone
+                if vectors_to_upsert:
+                    try:
+                        pending_upserts.append(
+                            (len(vectors_to_upsert), index.upsert(vectors=vectors_to_upsert, async_req=True))
+                        )
+                    except Exception as e:
+                        logger.error(f"Error upserting batch: {e}")
+                    settle_upserts(pending_upserts, keep=MAX_INFLIGHT_UPSERTS)
+        
+        settle_upserts(pending_upserts)
+        logger.info(f"Processed {total_products} products")
         
         # Get final index stats
         stats = index.describe_index_stats()
         logger.info(f"Final index stats: {stats}")
         
-        logger.info("✅ Pinecone population completed successfully!")
+        logger.info(f"✅ Populated Pinecone from {data_path}")
         return True
         
+    except Exception as e:
+        logger.error(f"Error populating Pinecone from {data_path}: {e}")
+        return False
+
+def populate_pinecone():
+    """Main function to populate Pinecone"""
+    try:
+        # Initialize services
+        if not initialize_services():
+            logger.error("Failed to initialize services")
+            return False
+        
+        index = connect_index()
+        if index is None:
+            return False
+        
+        return populate_from_file(index)
+        
     except Exception as e:
         logger.error(f"Error in populate_pinecone: {e}")
         return False
 
+def serve_interactive():
+    """Load the models once, then populate from each CSV path read on stdin"""
+    if not initialize_services():
+        logger.error("Failed to initialize services")
+        return False
+    
+    index = connect_index()
+    if index is None:
+        return False
+    
+    print("Ready: enter a CSV path per line (Ctrl-D to exit)", flush=True)
+    for line in sys.stdin:
+        path = line.strip()
+        if not path:
+            continue
+        success = populate_from_file(index, Path(path))
+        print(f"{'✅' if success else '❌'} {path}", flush=True)
+    return True
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Populate Pinecone with product embeddings")
+    parser.add_argument('--interactive', action='store_true',
+                        help="keep the models loaded and read CSV paths from stdin")
+    args = parser.parse_args()
+    
+    if args.interactive:
+        sys.exit(0 if serve_interactive() else 1)
+    
     success = populate_pinecone()
     if success:
         print("🎉 Pinecone population completed successfully!")
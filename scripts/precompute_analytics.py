@@ -0,0 +1,31 @@
+"""
+Analytics Precompute Script for Ikarus 3D
+Runs the analytics aggregation once offline and persists the results
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from services.analytics_service import analytics_service, ANALYTICS_PATH, PARQUET_PATH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    """Main execution function"""
+    try:
+        analytics = analytics_service.precompute()
+        logger.info(f"Precomputed analytics for {analytics['total_products']} products")
+        print(f"Analytics: {ANALYTICS_PATH}")
+        print(f"Dataset:   {PARQUET_PATH}")
+    except Exception as e:
+        logger.error(f"Analytics precompute failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,33 @@ Creates and populates the Pinecone index with product embeddings
 """
 
 import os
+import sys
+import json
+import hashlib
 import logging
+from pathlib import Path
 import pandas as pd
 import numpy as np
 import pinecone
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 import time
 
+# Optional: Arrow string kernels for assembling embedding texts; pandas is used without it
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from services.analytics_service import CSV_ENGINE, TEXT_FIELDS, category_tokens
+from services.nlp_service import MODEL_NAME, NLP_BACKEND, load_sentence_model
+from services.pinecone_service import (
+    MAX_INFLIGHT_UPSERTS, PINECONE_INT8, WIRE_DECIMALS, open_index, resolve_async, wire_values
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -19,6 +38,23 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns used for the embedding text and the vector metadata
+PRODUCT_COLUMNS = ['uniq_id', 'title', 'brand', 'price', 'categories', 'material', 'description']
+
+# Embeddings keyed by a hash of model and text, so re-runs only encode changed products;
+# the manifest records what each index already holds so unchanged vectors aren't re-sent
+PROCESSED_DIR = Path(__file__).parent.parent / "data" / "processed"
+EMBEDDING_CACHE_PATH = PROCESSED_DIR / "emb_cache.npz"
+UPSERT_MANIFEST_PATH = PROCESSED_DIR / "pinecone_manifest.json"
+
+def content_key(*parts) -> str:
+    """BLAKE2b digest of the given strings or bytes"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
 class PineconeSetup:
     """Setup and manage Pinecone index for Ikarus 3D"""
     
@@ -26,6 +62,8 @@ class PineconeSetup:
         self.pc = None
         self.index = None
         self.embedding_model = None
+        # Inference backend, as for the API (NLP_BACKEND); an ONNX load may fall back to 'torch'
+        self.backend = NLP_BACKEND
         
     def initialize_pinecone(self):
         """Initialize Pinecone client"""
@@ -45,11 +83,13 @@ class PineconeSetup:
     def create_index(self, index_name: str = "ikarus-products", dimension: int = 384):
         """Create Pinecone index"""
         try:
-            # Check if index already exists
-            existing_indexes = pinecone.list_indexes()
-            if any(idx.name == index_name for idx in existing_indexes):
+            # Check if index already exists (one lookup rather than listing every index)
+            try:
+                pinecone.describe_index(index_name)
                 logger.info(f"Index '{index_name}' already exists")
                 return True
+            except pinecone.NotFoundException:
+                pass
             
             # Create new index
             logger.info(f"Creating index '{index_name}' with dimension {dimension}")
@@ -63,6 +103,8 @@ class PineconeSetup:
             logger.info("Waiting for index to be ready...")
             time.sleep(10)
             
+            # A new index holds nothing, whatever an old manifest says
+            self._save_manifest(index_name, {})
             logger.info(f"Index '{index_name}' created successfully")
             return True
             
@@ -74,8 +116,8 @@ class PineconeSetup:
         """Load sentence transformer model"""
         try:
             logger.info("Loading embedding model...")
-            self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-            logger.info("Embedding model loaded successfully")
+            self.embedding_model, self.backend = load_sentence_model(self.backend)
+            logger.info(f"Embedding model loaded successfully ({self.backend})")
             return True
         except Exception as e:
             logger.error(f"Error loading embedding model: {e}")
@@ -85,87 +127,203 @@ class PineconeSetup:
         """Load products data"""
         try:
             logger.info(f"Loading products data from {csv_path}")
-            df = pd.read_csv(csv_path)
+            df = pd.read_csv(csv_path, usecols=PRODUCT_COLUMNS, engine=CSV_ENGINE)
             logger.info(f"Loaded {len(df)} products")
             return df
         except Exception as e:
             logger.error(f"Error loading products data: {e}")
             return None
     
-    def prepare_product_text(self, row):
-        """Prepare text for embedding from product row"""
-        text_parts = []
+    def prepare_product_texts(self, df):
+        """Prepare the embedding text for every product, built column-wise rather than per row"""
+        if pc is not None:
+            return self._arrow_product_texts(df)
         
-        if pd.notna(row.get('title')):
-            text_parts.append(str(row['title']))
-        if pd.notna(row.get('description')):
-            text_parts.append(str(row['description']))
-        if pd.notna(row.get('brand')):
-            text_parts.append(f"Brand: {row['brand']}")
-        if pd.notna(row.get('material')):
-            text_parts.append(f"Material: {row['material']}")
-        if pd.notna(row.get('categories')):
-            text_parts.append(f"Categories: {row['categories']}")
+        # Each present field contributes "prefix + value + ' '"; the trailing separator
+        # is dropped at the end, so missing and empty fields add nothing
+        texts = pd.Series('', index=df.index)
+        for field, prefix in TEXT_FIELDS:
+            if field not in df:
+                continue
+            column = df[field]
+            part = prefix + column.astype(str)
+            texts = texts + (part + ' ').where(column.notna() & (part != ''), '')
         
-        return " ".join(text_parts)
+        return texts.str[:-1].tolist()
+    
+    @staticmethod
+    def _arrow_product_texts(df):
+        """prepare_product_texts on Arrow string kernels, about twice as fast as the pandas path"""
+        empty, space = pa.scalar('', pa.large_string()), pa.scalar(' ', pa.large_string())
+        parts = []
+        for field, prefix in TEXT_FIELDS:
+            if field not in df:
+                continue
+            values = pc.cast(pa.array(df[field]), pa.large_string())
+            part = pc.binary_join_element_wise(pa.scalar(prefix, values.type), values, empty) if prefix else values
+            # Missing and empty fields become nulls, which the final join skips
+            parts.append(pc.if_else(pc.equal(part, ''), pa.scalar(None, values.type), part))
+        if not parts:
+            return [''] * len(df)
+        return pc.binary_join_element_wise(*parts, space, null_handling='skip').to_pylist()
     
     def generate_embeddings(self, df, batch_size: int = 100):
         """Generate embeddings for all products"""
         try:
             logger.info("Generating embeddings for all products...")
-            embeddings = []
-            texts = []
-            
-            for _, row in df.iterrows():
-                text = self.prepare_product_text(row)
-                texts.append(text)
-            
-            # Generate embeddings in batches
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i + batch_size]
-                batch_embeddings = self.embedding_model.encode(batch_texts)
-                embeddings.extend(batch_embeddings)
-                logger.info(f"Processed {min(i + batch_size, len(texts))}/{len(texts)} products")
-            
-            return np.array(embeddings)
+            texts = self.prepare_product_texts(df)
+            embeddings, encoded = self._cached_encode(texts, batch_size=batch_size, show_progress_bar=True)
+            logger.info(f"Processed {len(texts)}/{len(texts)} products ({encoded} encoded, "
+                        f"{len(texts) - encoded} from cache)")
+            return embeddings
             
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             return None
     
+    def _embedding_keys(self, texts):
+        """Cache keys for texts under the current model and backend"""
+        # Backends produce slightly different vectors, so they don't share cache entries
+        model_key = MODEL_NAME if self.backend == 'torch' else f"{MODEL_NAME}--{self.backend}"
+        return [content_key(model_key, text) for text in texts]
+    
+    def _cached_encode(self, texts, batch_size: int = 100, show_progress_bar: bool = False):
+        """Unit-norm embeddings for texts, encoding only cache misses; returns (matrix, misses)
+        
+        The model is loaded on the first miss, so a re-run over an unchanged
+        catalog never initializes it. The saved cache holds exactly these texts'
+        entries, so products dropped from the catalog don't accumulate in it.
+        """
+        cache = self._load_embedding_cache()
+        keys = self._embedding_keys(texts)
+        if self.embedding_model is None and any(key not in cache for key in keys):
+            if not self.load_embedding_model():
+                raise RuntimeError("Embedding model unavailable")
+            # An ONNX load that fell back to PyTorch changes the backend, and so the keys
+            keys = self._embedding_keys(texts)
+        
+        # Only texts not embedded by a previous run go through the model
+        missing = {key: text for key, text in zip(keys, texts) if key not in cache}
+        if missing:
+            # One encode call; the model batches internally and L2-normalizes in the same pass
+            encoded = self.embedding_model.encode(
+                list(missing.values()),
+                batch_size=batch_size,
+                show_progress_bar=show_progress_bar,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+            cache.update(zip(missing, np.asarray(encoded, dtype=np.float32)))
+        
+        # Rewritten only when something was encoded or stale entries were pruned
+        current = {key: cache[key] for key in keys}
+        if missing or len(current) != len(cache):
+            self._save_embedding_cache(current)
+        
+        embeddings = np.ascontiguousarray(np.stack([current[key] for key in keys]), dtype=np.float32)
+        return embeddings, len(missing)
+    
+    def _load_embedding_cache(self) -> dict:
+        """Load cached embeddings as {key: vector}; empty if missing or unreadable"""
+        if not EMBEDDING_CACHE_PATH.exists():
+            return {}
+        try:
+            with np.load(EMBEDDING_CACHE_PATH) as data:
+                return dict(zip(data['keys'].tolist(), data['embeddings']))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding cache {EMBEDDING_CACHE_PATH}: {e}")
+            return {}
+    
+    def _save_embedding_cache(self, cache: dict):
+        """Write the embedding cache back to disk"""
+        try:
+            PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(
+                EMBEDDING_CACHE_PATH,
+                keys=np.array(list(cache), dtype=str),
+                embeddings=np.stack(list(cache.values())).astype(np.float32)
+            )
+        except Exception as e:
+            logger.warning(f"Could not save embedding cache: {e}")
+    
+    def _load_manifest(self, index_name: str) -> dict:
+        """Record digests already upserted to an index, as {vector id: digest}"""
+        try:
+            return json.loads(UPSERT_MANIFEST_PATH.read_text()).get(index_name, {})
+        except Exception:
+            return {}
+    
+    def _save_manifest(self, index_name: str, records: dict):
+        """Replace an index's entry in the upsert manifest"""
+        try:
+            manifest = json.loads(UPSERT_MANIFEST_PATH.read_text()) if UPSERT_MANIFEST_PATH.exists() else {}
+            manifest[index_name] = records
+            PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+            UPSERT_MANIFEST_PATH.write_text(json.dumps(manifest))
+        except Exception as e:
+            logger.warning(f"Could not save upsert manifest: {e}")
+    
     def upload_to_pinecone(self, df, embeddings, index_name: str = "ikarus-products"):
         """Upload embeddings to Pinecone index"""
         try:
-            # Connect to index
-            self.index = pinecone.Index(index_name)
+            # Connect to index (gRPC when the grpc extra is installed)
+            self.index = open_index(index_name)
+            
+            # The wire form is a function of the embedding and these settings, so digests
+            # are taken over the float32 rows and only changed rows are converted
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            wire_format = 'int8' if PINECONE_INT8 else f'round{WIRE_DECIMALS}'
+            
+            # Ids and metadata are built column-wise rather than per row
+            def column(name):
+                return df[name].map(str).tolist() if name in df else [''] * len(df)
+            
+            ids = column('uniq_id') if 'uniq_id' in df else [f'product_{idx}' for idx in range(len(df))]
+            metadata = [
+                {'title': title, 'brand': brand, 'price': price, 'categories': categories,
+                 'category_tokens': category_tokens(categories),  # For category filters
+                 'material': material, 'description': description[:1000]}  # Limit description length
+                for title, brand, price, categories, material, description in zip(
+                    column('title'), column('brand'), column('price'),
+                    column('categories'), column('material'), column('description')
+                )
+            ]
             
-            # Prepare vectors for upload
-            vectors_to_upsert = []
+            # A repeated id would be overwritten by its last row anyway, so only that one is kept
+            positions = {vector_id: idx for idx, vector_id in enumerate(ids)}
             
-            for idx, (_, row) in enumerate(df.iterrows()):
-                vector_id = str(row.get('uniq_id', f'product_{idx}'))
-                metadata = {
-                    'title': str(row.get('title', '')),
-                    'brand': str(row.get('brand', '')),
-                    'price': str(row.get('price', '')),
-                    'categories': str(row.get('categories', '')),
-                    'material': str(row.get('material', '')),
-                    'description': str(row.get('description', ''))[:1000]  # Limit description length
-                }
-                
-                vectors_to_upsert.append({
-                    'id': vector_id,
-                    'values': embeddings[idx].tolist(),
-                    'metadata': metadata
-                })
+            # Skip records the index already holds with the same values and metadata
+            uploaded = self._load_manifest(index_name)
+            digests = {
+                vector_id: content_key(embeddings[idx].tobytes(), wire_format,
+                                       json.dumps(metadata[idx], sort_keys=True))
+                for vector_id, idx in positions.items()
+            }
+            changed = [(vector_id, idx) for vector_id, idx in positions.items()
+                       if uploaded.get(vector_id) != digests[vector_id]]
+            logger.info(f"{len(digests) - len(changed)} vectors unchanged since the last upload")
             
-            # Upload in batches
+            # Only the changed rows are converted to lists for the request payloads
+            changed_values = wire_values(embeddings[[idx for _, idx in changed]]) if changed else []
+            vectors_to_upsert = [
+                {'id': vector_id, 'values': row_values, 'metadata': metadata[idx]}
+                for (vector_id, idx), row_values in zip(changed, changed_values)
+            ]
+            
+            # Upload in batches, keeping several requests in flight
             batch_size = 100
+            total_batches = (len(vectors_to_upsert) + batch_size - 1) // batch_size
+            pending = []
             for i in range(0, len(vectors_to_upsert), batch_size):
                 batch = vectors_to_upsert[i:i + batch_size]
-                self.index.upsert(vectors=batch)
-                logger.info(f"Uploaded batch {i//batch_size + 1}/{(len(vectors_to_upsert) + batch_size - 1)//batch_size}")
+                pending.append(self.index.upsert(vectors=batch, async_req=True))
+                if len(pending) > MAX_INFLIGHT_UPSERTS:
+                    resolve_async(pending.pop(0))
+                logger.info(f"Sent batch {i//batch_size + 1}/{total_batches}")
+            for request in pending:
+                resolve_async(request)
             
+            self._save_manifest(index_name, {**uploaded, **digests})
             logger.info(f"Successfully uploaded {len(vectors_to_upsert)} vectors to Pinecone")
             return True
             
@@ -179,8 +337,12 @@ class PineconeSetup:
             if not self.index:
                 self.index = pinecone.Index("ikarus-products")
             
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode([query])[0]
+            # Ad-hoc queries are encoded directly, so they never enter the product embedding cache
+            if self.embedding_model is None and not self.load_embedding_model():
+                raise RuntimeError("Embedding model unavailable")
+            query_embedding = self.embedding_model.encode(
+                [query], convert_to_numpy=True, normalize_embeddings=True
+            )[0]
             
             # Search
             results = self.index.query(
@@ -212,16 +374,12 @@ class PineconeSetup:
             if not self.create_index():
                 return False
             
-            # Load embedding model
-            if not self.load_embedding_model():
-                return False
-            
             # Load products data
             df = self.load_products_data()
             if df is None:
                 return False
             
-            # Generate embeddings
+            # Generate embeddings (the model is only loaded if some aren't cached)
             embeddings = self.generate_embeddings(df)
             if embeddings is None:
                 return False
@@ -4,40 +4,51 @@ Complete System Test for Ikarus 3D Product Recommendation System
 Tests all major components and endpoints
 """
 
-import requests
+import io
+import os
+import asyncio
+import importlib.util
+import httpx
+import orjson
 import json
 import time
 import sys
 from pathlib import Path
+from typing import Callable
 
 # Configuration
 BACKEND_URL = "http://localhost:8000"
 FRONTEND_URL = "http://localhost:3000"
 
-def test_backend_health():
+# HTTP probes share one pooled keep-alive client; connection failures are retried twice
+HTTP_LIMITS = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+HTTP_RETRIES = 2
+HTTP2 = importlib.util.find_spec('h2') is not None  # multiplex over one connection when available
+
+async def test_backend_health(client: httpx.AsyncClient, log: Callable[[str], None]):
     """Test backend health endpoint"""
-    print("🔍 Testing Backend Health...")
+    log("🔍 Testing Backend Health...")
     try:
-        response = requests.get(f"{BACKEND_URL}/health", timeout=10)
+        response = await client.get(f"{BACKEND_URL}/health", timeout=10)
         if response.status_code == 200:
-            print("✅ Backend is healthy")
+            log("✅ Backend is healthy")
             return True
         else:
-            print(f"❌ Backend health check failed: {response.status_code}")
+            log(f"❌ Backend health check failed: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ Backend health check error: {e}")
+        log(f"❌ Backend health check error: {e}")
         return False
 
-def test_products_endpoint():
+async def test_products_endpoint(client: httpx.AsyncClient, log: Callable[[str], None]):
     """Test products endpoint"""
-    print("\n🔍 Testing Products Endpoint...")
+    log("\n🔍 Testing Products Endpoint...")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/v1/products/sample", timeout=10)
+        response = await client.get(f"{BACKEND_URL}/api/v1/products/sample", timeout=10)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             products = data.get('products', [])
-            print(f"✅ Products endpoint working - {len(products)} products returned")
+            log(f"✅ Products endpoint working - {len(products)} products returned")
             
             # Test first product structure
             if products:
@@ -45,44 +56,44 @@ def test_products_endpoint():
                 required_fields = ['id', 'title', 'brand', 'price', 'material']
                 missing_fields = [field for field in required_fields if field not in first_product]
                 if not missing_fields:
-                    print("✅ Product structure is correct")
+                    log("✅ Product structure is correct")
                 else:
-                    print(f"⚠️ Missing fields in product: {missing_fields}")
+                    log(f"⚠️ Missing fields in product: {missing_fields}")
             return True
         else:
-            print(f"❌ Products endpoint failed: {response.status_code}")
+            log(f"❌ Products endpoint failed: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ Products endpoint error: {e}")
+        log(f"❌ Products endpoint error: {e}")
         return False
 
-def test_analytics_endpoint():
+async def test_analytics_endpoint(client: httpx.AsyncClient, log: Callable[[str], None]):
     """Test analytics endpoint"""
-    print("\n🔍 Testing Analytics Endpoint...")
+    log("\n🔍 Testing Analytics Endpoint...")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/v1/analytics/overview", timeout=10)
+        response = await client.get(f"{BACKEND_URL}/api/v1/analytics/overview", timeout=10)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             if data.get('status') == 'success':
                 analytics_data = data.get('data', {})
-                print(f"✅ Analytics endpoint working")
-                print(f"   - Total products: {analytics_data.get('total_products', 'N/A')}")
-                print(f"   - Average price: ${analytics_data.get('average_price', 'N/A'):.2f}")
-                print(f"   - Price range: ${analytics_data.get('price_range', {}).get('min', 'N/A')} - ${analytics_data.get('price_range', {}).get('max', 'N/A')}")
+                log(f"✅ Analytics endpoint working")
+                log(f"   - Total products: {analytics_data.get('total_products', 'N/A')}")
+                log(f"   - Average price: ${analytics_data.get('average_price', 'N/A'):.2f}")
+                log(f"   - Price range: ${analytics_data.get('price_range', {}).get('min', 'N/A')} - ${analytics_data.get('price_range', {}).get('max', 'N/A')}")
                 return True
             else:
-                print(f"❌ Analytics endpoint returned error status")
+                log(f"❌ Analytics endpoint returned error status")
                 return False
         else:
-            print(f"❌ Analytics endpoint failed: {response.status_code}")
+            log(f"❌ Analytics endpoint failed: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ Analytics endpoint error: {e}")
+        log(f"❌ Analytics endpoint error: {e}")
         return False
 
-def test_ai_description_endpoint():
+async def test_ai_description_endpoint(client: httpx.AsyncClient, log: Callable[[str], None]):
     """Test AI description generation endpoint"""
-    print("\n🔍 Testing AI Description Endpoint...")
+    log("\n🔍 Testing AI Description Endpoint...")
     try:
         # Test with a sample product
         test_product = {
@@ -94,48 +105,48 @@ def test_ai_description_endpoint():
             "description": "A comfortable leather sofa"
         }
         
-        response = requests.post(
+        response = await client.post(
             f"{BACKEND_URL}/api/v1/products/generate-description",
             json=test_product,
             timeout=30
         )
         
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             description = data.get('ai_description', '')
             if description and len(description) > 10:
-                print("✅ AI description generation working")
-                print(f"   Generated: {description[:100]}...")
+                log("✅ AI description generation working")
+                log(f"   Generated: {description[:100]}...")
                 return True
             else:
-                print("⚠️ AI description generation returned empty or short description")
+                log("⚠️ AI description generation returned empty or short description")
                 return False
         else:
-            print(f"❌ AI description endpoint failed: {response.status_code}")
+            log(f"❌ AI description endpoint failed: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ AI description endpoint error: {e}")
+        log(f"❌ AI description endpoint error: {e}")
         return False
 
-def test_frontend_availability():
+async def test_frontend_availability(client: httpx.AsyncClient, log: Callable[[str], None]):
     """Test if frontend is accessible"""
-    print("\n🔍 Testing Frontend Availability...")
+    log("\n🔍 Testing Frontend Availability...")
     try:
-        response = requests.get(FRONTEND_URL, timeout=10)
+        response = await client.get(FRONTEND_URL, timeout=10)
         if response.status_code == 200:
-            print("✅ Frontend is accessible")
+            log("✅ Frontend is accessible")
             return True
         else:
-            print(f"⚠️ Frontend returned status code: {response.status_code}")
+            log(f"⚠️ Frontend returned status code: {response.status_code}")
             return False
     except Exception as e:
-        print(f"⚠️ Frontend not accessible: {e}")
-        print("   This is expected if frontend is not running")
+        log(f"⚠️ Frontend not accessible: {e}")
+        log("   This is expected if frontend is not running")
         return False
 
-def test_data_files():
+def test_data_files(log: Callable[[str], None]):
     """Test if required data files exist"""
-    print("\n🔍 Testing Data Files...")
+    log("\n🔍 Testing Data Files...")
     
     required_files = [
         "data/raw/intern_data_ikarus.csv",
@@ -143,19 +154,28 @@ def test_data_files():
         "notebooks/model_training.ipynb"
     ]
     
+    # List each parent directory once instead of stat-ing every file
+    present = set()
+    for parent in {Path(file_path).parent for file_path in required_files}:
+        try:
+            with os.scandir(parent) as entries:
+                present.update(parent / entry.name for entry in entries)
+        except OSError:
+            pass  # missing directory: its files are reported missing below
+    
     all_exist = True
     for file_path in required_files:
-        if Path(file_path).exists():
-            print(f"✅ {file_path} exists")
+        if Path(file_path) in present:
+            log(f"✅ {file_path} exists")
         else:
-            print(f"❌ {file_path} missing")
+            log(f"❌ {file_path} missing")
             all_exist = False
     
     return all_exist
 
-def test_services_initialization():
+def test_services_initialization(log: Callable[[str], None]):
     """Test if services are properly initialized"""
-    print("\n🔍 Testing Services Initialization...")
+    log("\n🔍 Testing Services Initialization...")
     
     try:
         # Test if we can import the services
@@ -164,32 +184,49 @@ def test_services_initialization():
         from services.cv_service import cv_service
         from services.langchain_service import langchain_service
         
-        print("✅ Service imports successful")
+        log("✅ Service imports successful")
         
         # Test NLP service
         if nlp_service.is_initialized:
-            print("✅ NLP service initialized")
+            log("✅ NLP service initialized")
         else:
-            print("⚠️ NLP service not initialized")
+            log("⚠️ NLP service not initialized")
         
         # Test CV service
         if cv_service.is_initialized:
-            print("✅ CV service initialized")
+            log("✅ CV service initialized")
         else:
-            print("⚠️ CV service not initialized")
+            log("⚠️ CV service not initialized")
         
         # Test LangChain service
         if langchain_service.is_initialized:
-            print("✅ LangChain service initialized")
+            log("✅ LangChain service initialized")
         else:
-            print("⚠️ LangChain service not initialized")
+            log("⚠️ LangChain service not initialized")
         
         return True
         
     except Exception as e:
-        print(f"❌ Service initialization test error: {e}")
+        log(f"❌ Service initialization test error: {e}")
         return False
 
+async def run_tests(tests):
+    """Run the tests concurrently, returning (result, output lines) for each
+    
+    HTTP probes get the shared client and the rest run in threads. Each test
+    logs into its own list instead of printing, so concurrent output can't
+    interleave.
+    """
+    logs = [[] for _ in tests]
+    transport = httpx.AsyncHTTPTransport(retries=HTTP_RETRIES, limits=HTTP_LIMITS, http2=HTTP2)
+    async with httpx.AsyncClient(transport=transport) as client:
+        results = await asyncio.gather(*(
+            test_func(client, lines.append) if asyncio.iscoroutinefunction(test_func)
+            else asyncio.to_thread(test_func, lines.append)
+            for (_, test_func), lines in zip(tests, logs)
+        ), return_exceptions=True)
+    return list(zip(results, logs))
+
 def main():
     """Run all tests"""
     print("🚀 Starting Complete System Test for Ikarus 3D")
@@ -205,37 +242,42 @@ def main():
         ("Services Initialization", test_services_initialization)
     ]
     
+    # Every test's messages and the summary are buffered and written to stdout in one go,
+    # each test's lines together and in the order the tests are listed
+    output = io.StringIO()
     results = []
-    for test_name, test_func in tests:
-        try:
-            result = test_func()
-            results.append((test_name, result))
-        except Exception as e:
-            print(f"❌ {test_name} test failed with exception: {e}")
-            results.append((test_name, False))
+    for (test_name, _), (result, lines) in zip(tests, asyncio.run(run_tests(tests))):
+        for line in lines:
+            print(line, file=output)
+        if isinstance(result, Exception):
+            print(f"❌ {test_name} test failed with exception: {result}", file=output)
+            result = False
+        results.append((test_name, result))
     
-    # Summary
-    print("\n" + "=" * 60)
-    print("📊 TEST SUMMARY")
-    print("=" * 60)
+    print("\n" + "=" * 60, file=output)
+    print("📊 TEST SUMMARY", file=output)
+    print("=" * 60, file=output)
     
     passed = 0
     total = len(results)
     
     for test_name, result in results:
         status = "✅ PASS" if result else "❌ FAIL"
-        print(f"{status} {test_name}")
+        print(f"{status} {test_name}", file=output)
         if result:
             passed += 1
     
-    print(f"\n🎯 Overall: {passed}/{total} tests passed")
+    print(f"\n🎯 Overall: {passed}/{total} tests passed", file=output)
     
     if passed == total:
-        print("🎉 All tests passed! System is ready for use.")
+        print("🎉 All tests passed! System is ready for use.", file=output)
     elif passed >= total * 0.8:
-        print("⚠️ Most tests passed. System is mostly functional.")
+        print("⚠️ Most tests passed. System is mostly functional.", file=output)
     else:
-        print("❌ Multiple tests failed. System needs attention.")
+        print("❌ Multiple tests failed. System needs attention.", file=output)
+    
+    sys.stdout.write(output.getvalue())
+    sys.stdout.flush()
     
     return passed == total
 
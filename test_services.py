@@ -81,7 +81,10 @@ def test_basic_functionality():
         if cv_service.is_initialized:
             # Test with a dummy image URL
             embedding = cv_service.get_image_embedding("https://example.com/image.jpg")
-            print(f"SUCCESS: CV embedding generated: {len(embedding)} dimensions")
+            if embedding is not None:
+                print(f"SUCCESS: CV embedding generated: {len(embedding)} dimensions")
+            else:
+                print("WARNING: CV test image could not be loaded, no embedding generated")
         else:
             print("WARNING: CV service not initialized, skipping test")
     except Exception as e: